@@ -0,0 +1,207 @@
+"""Local stand-ins for the SeAT api routes and ESI name endpoints the plugin uses.
+
+The generated corp, tower, poco, trade, contract and job counts, the latency of
+every response and the share of requests answered with a 500 are configurable.
+Every request is counted per route in FakeUpstream.calls, response body bytes in
+FakeUpstream.bytes. GET responses carry an ETag and If-None-Match is answered
+with a 304 like ESI does.
+"""
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEAT_ROUTE = re.compile(
+    r'^/api/corporation/(all|starbases|pocos|wallet-transactions|contracts|industry)(?:/(\d+))?$')
+ESI_ROUTE = re.compile(r'^/esi/(characters|corporations|alliances|universe/types|universe/stations)/(\d+)/?$')
+SYSTEMS = ('Jita', 'Perimeter', 'Amarr', 'Dodixie', 'Rens', 'Hek', 'Jatate', 'Tama')
+STATIONS = (60003760, 60008494, 60011866, 60004588)
+CITADEL = 1022734985679
+
+
+def seat_date(delta):
+    return (datetime.datetime.utcnow() + delta).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # a fresh client session opens HTTP_HOST_CONCURRENCY connections at once, a full
+    # backlog drops their SYNs and adds a second of retransmit to the step
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections on shutdown are expected
+        pass
+
+
+class FakeUpstream(object):
+
+    def __init__(self, corps=5, towers=20, pocos=10, rows=200, per_page=50, latency=0.0, error_rate=0.0,
+                 seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.per_page = per_page
+        self.calls = Counter()
+        self.bytes = 0
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.corps = [{'corporationID': 98000000 + i, 'ticker': 'C%03d' % i} for i in range(corps)]
+        self.starbases = {}
+        self.pocos = {}
+        for c, corp in enumerate(self.corps):
+            self.starbases[corp['corporationID']] = [self.starbase(c * towers + i) for i in range(towers)]
+            self.pocos[corp['corporationID']] = [{
+                'solarSystemName': SYSTEMS[i % len(SYSTEMS)],
+                'planetName': '%s %s' % (SYSTEMS[i % len(SYSTEMS)], 'IV'),
+                'planetTypeName': 'Planet (Barren)'} for i in range(pocos)]
+        self.transactions = [self.transaction(i + 1) for i in range(rows)]
+        self.contracts = [self.contract(i + 1) for i in range(rows)]
+        self.jobs = [self.job(i + 1) for i in range(rows)]
+        self.server = None
+
+    def starbase(self, i):
+        state = self.random.choice((4, 4, 4, 4, 3, 1, 0))
+        return {
+            'itemID': 1000000000 + i,
+            'moonName': '%s %d - Moon %d' % (SYSTEMS[i % len(SYSTEMS)], i % 9 + 1, i % 20 + 1),
+            'solarSystemName': SYSTEMS[i % len(SYSTEMS)],
+            'starbaseTypeName': self.random.choice(('Caldari Control Tower', 'Amarr Control Tower Small')),
+            'state': state,
+            'fuelBlocks': self.random.randint(0, 40 * 24 * 14),
+            'baseFuelUsage': 40,
+            'strontium': self.random.choice((0, 400, 8000)),
+            'baseStrontUsage': 400,
+            'updated_at': seat_date(-datetime.timedelta(hours=self.random.randint(0, 20))),
+            'stateTimeStamp': seat_date(datetime.timedelta(hours=self.random.randint(1, 40))),
+        }
+
+    def transaction(self, i):
+        return {'transaction_id': i, 'quantity': self.random.randint(1, 1000), 'is_buy': i % 2,
+                'type': {'typeName': 'Tritanium'}, 'unit_price': self.random.random() * 100}
+
+    def contract(self, i):
+        return {'contract_id': i, 'detail': {
+            'contract_id': i, 'type': 'courier' if i % 3 else 'item_exchange',
+            'status': self.random.choice(('outstanding', 'in_progress', 'finished')),
+            'reward': 1e6, 'collateral': 1e8, 'volume': 12000,
+            'start_location_id': self.random.choice(STATIONS), 'end_location_id': self.random.choice(STATIONS),
+            'date_expired': seat_date(datetime.timedelta(days=self.random.randint(-3, 7)))}}
+
+    def job(self, i):
+        return {'job_id': i, 'installer_id': 90000000 + i % 25, 'status': self.random.choice(('active', 'delivered')),
+                'facility_id': CITADEL if i % 10 == 0 else self.random.choice(STATIONS),
+                'blueprint_type_id': 680 + i % 40,
+                'end_date': seat_date(datetime.timedelta(hours=self.random.randint(-48, 240)))}
+
+    def add_rows(self, count):
+        """Appends new trades, contracts and jobs as if the corp had been busy"""
+        for rows, make in ((self.transactions, self.transaction), (self.contracts, self.contract),
+                           (self.jobs, self.job)):
+            rows.extend(make(len(rows) + i + 1) for i in range(count))
+
+    def paginate(self, rows, page):
+        last_page = max(1, -(-len(rows) // self.per_page))
+        return {'data': rows[(page - 1) * self.per_page:page * self.per_page],
+                'meta': {'current_page': page, 'last_page': last_page}}
+
+    def name(self, id):
+        if id in STATIONS:
+            return {'id': id, 'category': 'station', 'name': 'Station %d' % id}
+        if 90000000 <= id < 91000000:
+            return {'id': id, 'category': 'character', 'name': 'Pilot %d' % id}
+        if 98000000 <= id < 99000000:
+            return {'id': id, 'category': 'corporation', 'name': 'Corp %d' % id}
+        if id < 100000:
+            return {'id': id, 'category': 'inventory_type', 'name': 'Blueprint %d' % id}
+        return None
+
+    def count(self, route):
+        with self._lock:
+            self.calls[route] += 1
+
+    def handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                etag = '"%s"' % hashlib.md5(data).hexdigest()
+                if status == 200 and self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+                    status, data = 304, b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if self.command == 'GET':
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(data)
+                with upstream._lock:
+                    upstream.bytes += len(data)
+
+            def failed(self):
+                time.sleep(upstream.latency)
+                if upstream.error_rate and upstream.random.random() < upstream.error_rate:
+                    self.reply(500, {'error': 'fake upstream error'})
+                    return True
+                return False
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                match = SEAT_ROUTE.match(path)
+                if match:
+                    kind, corp = match.group(1), match.group(2)
+                    upstream.count('seat ' + kind)
+                    if self.failed():
+                        return
+                    if kind == 'all':
+                        return self.reply(200, upstream.corps)
+                    if kind in ('starbases', 'pocos'):
+                        rows = getattr(upstream, kind).get(int(corp))
+                        return self.reply(200 if rows is not None else 404, rows if rows is not None else {})
+                    page = int(query.split('=')[1]) if query.startswith('page=') else 1
+                    rows = {'wallet-transactions': upstream.transactions, 'contracts': upstream.contracts,
+                            'industry': upstream.jobs}[kind]
+                    return self.reply(200, upstream.paginate(rows, page))
+                match = ESI_ROUTE.match(path)
+                if match:
+                    upstream.count('esi ' + match.group(1))
+                    if self.failed():
+                        return
+                    name = upstream.name(int(match.group(2)))
+                    return self.reply(200 if name else 404, {'name': name['name']} if name else {})
+                upstream.count('unknown')
+                self.reply(404, {})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'[]')
+                if self.path.rstrip('/') != '/esi/universe/names':
+                    upstream.count('unknown')
+                    return self.reply(404, {})
+                upstream.count('esi universe/names')
+                if self.failed():
+                    return
+                names = [upstream.name(id) for id in body]
+                if None in names:
+                    return self.reply(404, {'error': 'Ensure all IDs are valid before resolving.'})
+                self.reply(200, names)
+
+        return Handler
+
+    def start(self):
+        self.server = QuietServer(('127.0.0.1', 0), self.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
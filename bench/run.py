@@ -0,0 +1,225 @@
+"""Offline benchmark of the seat plugin against fake SeAT/ESI servers and fakeredis.
+
+Runs every poller (cold, steady state and after a burst of new rows) and every
+listing command, restarts the plugin and runs them once more, and reports wall
+time, upstream requests, redis round trips, announcements and peak python memory
+of each step.
+
+    python bench/run.py --corps 20 --towers 100 --rows 2000 --latency 0.05
+    python bench/run.py --warm-start
+    python bench/run.py --json > bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import fakeredis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_errbot  # noqa: E402
+from fake_upstream import FakeUpstream  # noqa: E402
+
+stub_errbot.install()
+import seat  # noqa: E402
+
+
+class CountingRedis(fakeredis.FakeStrictRedis):
+    """fakeredis client counting round trips, a pipeline counts once"""
+
+    round_trips = 0
+
+    def execute_command(self, *args, **kwargs):
+        CountingRedis.round_trips += 1
+        return super(CountingRedis, self).execute_command(*args, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super(CountingRedis, self).pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def counted(*args, **kwargs):
+            CountingRedis.round_trips += 1
+            return execute(*args, **kwargs)
+        pipe.execute = counted
+        return pipe
+
+
+def make_plugin(url, args, client, storage, data_dir):
+    seat.redis = types.SimpleNamespace(
+        StrictRedis=lambda *a, **kw: client, ConnectionPool=lambda *a, **kw: None)
+    seat.ESI_URL = url + '/esi'
+    plugin = seat.Seat()
+    plugin._storage = storage
+    plugin.bot_config.BOT_DATA_DIR = data_dir
+    config = {
+        'SEAT_URL': url + '/api', 'SEAT_TOKEN': 'bench', 'CORP_ID': 98000000,
+        'REPORT_POS_CHAN': '#pos', 'REPORT_TRADES_CHAN': '#trades', 'REPORT_CONTRACTS_CHAN': '#contracts',
+        'REPORT_INDUSTRY_CHAN': '#industry', 'REPORT_REINF_CHAN': '#pos',
+        'DISPATCH_WINDOW': 0, 'SEND_RATE': 10 ** 6, 'SEND_BURST': 10 ** 6,
+        'CORP_IDS': [98000000 + i for i in range(args.stream_corps)],
+        'SYNC_MAX_PAGES': args.sync_pages, 'HTTP_CACHE_TTL': args.cache_ttl,
+        'WARM_START_FILE': 'warm-start.z' if args.warm_start else '',
+        'CHECK_STRUCTURES': False, 'CHECK_TRADES': False, 'CHECK_CONTRACTS': False, 'CHECK_INDUSTRY': False,
+    }
+    # like !plugin config, the config has to pass the plugin's check first
+    plugin.check_configuration(config)
+    plugin.configure(config)
+    plugin.activate()
+    plugin.announced = 0
+    enqueue = plugin.dispatcher.enqueue
+
+    def counted(channel, text):
+        plugin.announced += 1
+        enqueue(channel, text)
+    plugin.dispatcher.enqueue = counted
+    return plugin
+
+
+def wait_for_snapshot(plugin, timeout=30):
+    """Waits for the warm start (or cold fetch) of the snapshot that runs right after activation"""
+    deadline = time.time() + timeout
+    while plugin.structures.snapshot is None:
+        if time.time() > deadline:
+            raise RuntimeError('no pos snapshot {}s after activation'.format(timeout))
+        time.sleep(0.01)
+
+
+def measure(name, upstream, plugin, func):
+    upstream.calls.clear()
+    upstream.bytes = 0
+    CountingRedis.round_trips = 0
+    plugin.announced = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    try:
+        replies = func()
+    except Exception as e:
+        replies, error = None, repr(e)
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'step': name,
+        'wall_ms': round(wall * 1000, 1),
+        'http_calls': sum(upstream.calls.values()),
+        'http_by_route': dict(upstream.calls),
+        'http_kib': round(upstream.bytes / 1024, 1),
+        'redis_round_trips': CountingRedis.round_trips,
+        'announcements': plugin.announced,
+        'replies': len(replies) if isinstance(replies, list) else 0,
+        'peak_kib': round(peak / 1024, 1),
+        'error': error,
+    }
+
+
+COMMANDS = (('pos_find', 'jita'), ('pos_find', 'pe'), ('poco_find', 'amarr'), ('pos_oof', '48'),
+            ('pos_reinforced', ''), ('pos_oos', ''), ('pos_offline', ''), ('pos_history', 'jita 1 - moon 1'),
+            ('pos_burn', ''), ('jobs_all', ''), ('jobs_all', '--limit 500 --sort -end'), ('seat_upcoming', '48'),
+            ('seat_stats', ''))
+
+
+def pollers(plugin):
+    def pos_refresh():
+        plugin.structures.invalidate()
+        plugin._poller_pos_check()
+
+    return [('pos', pos_refresh), ('trades', plugin._poller_transactions_check),
+            ('contracts', plugin._poller_contracts_check), ('industry', plugin._poller_industry_check)]
+
+
+def command(plugin, name, text):
+    return lambda: list(getattr(plugin, name)(None, text))
+
+
+def steps(plugin, upstream, args):
+    for name, func in pollers(plugin):
+        yield 'poller %s cold' % name, func
+    for name, func in pollers(plugin):
+        yield 'poller %s steady' % name, func
+    yield 'burst of %d rows' % args.burst, lambda: upstream.add_rows(args.burst)
+    for name, func in pollers(plugin)[1:]:
+        yield 'poller %s after burst' % name, func
+    for name, text in COMMANDS:
+        yield ('!%s %s' % (name.replace('_', ' '), text)).strip(), command(plugin, name, text)
+
+
+def restart_steps(plugin):
+    """Steps after a restart, the pos poller keeps the snapshot the restart brought"""
+    yield '!pos find jita after restart', command(plugin, 'pos_find', 'jita')
+    yield '!jobs all after restart', command(plugin, 'jobs_all', '')
+    yield 'poller pos after restart', plugin._poller_pos_check
+    for name, func in pollers(plugin)[1:]:
+        yield 'poller %s after restart' % name, func
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--corps', type=int, default=5)
+    parser.add_argument('--towers', type=int, default=50, help='starbases per corp')
+    parser.add_argument('--stream-corps', type=int, default=1,
+                        help='corps whose trades, contracts and jobs are polled (CORP_IDS)')
+    parser.add_argument('--pocos', type=int, default=20, help='pocos per corp')
+    parser.add_argument('--rows', type=int, default=500, help='trades, contracts and jobs each')
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--burst', type=int, default=300, help='rows added before the burst step')
+    parser.add_argument('--sync-pages', type=int, default=4, help='SYNC_MAX_PAGES')
+    parser.add_argument('--cache-ttl', type=int, default=0,
+                        help='HTTP_CACHE_TTL, 0 revalidates every request with its etag')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per upstream response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of upstream 500s')
+    parser.add_argument('--warm-start', action='store_true',
+                        help='keep snapshot, names and responses across the restart (WARM_START_FILE)')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    upstream = FakeUpstream(args.corps, args.towers, args.pocos, args.rows, args.per_page, args.latency,
+                            args.error_rate)
+    url = upstream.start()
+    client = CountingRedis(server=fakeredis.FakeServer())
+    storage = {}
+    data_dir = tempfile.mkdtemp(prefix='seat-bench-')
+    plugin = make_plugin(url, args, client, storage, data_dir)
+    try:
+        try:
+            wait_for_snapshot(plugin)
+        except RuntimeError as e:
+            # the cold steps fetch it again and show what fails
+            print('warning: {}'.format(e), file=sys.stderr)
+        results = [measure(name, upstream, plugin, func) for name, func in steps(plugin, upstream, args)]
+        plugin.deactivate()
+        # a new plugin instance on the same redis, storage and data dir
+        restart = {}
+
+        def start_again():
+            restart['plugin'] = make_plugin(url, args, client, storage, data_dir)
+            wait_for_snapshot(restart['plugin'])
+        results.append(measure('restart', upstream, plugin, start_again))
+        plugin = restart.get('plugin', plugin)
+        plugin.announced = 0
+        results += [measure(name, upstream, plugin, func) for name, func in restart_steps(plugin)]
+    finally:
+        plugin.deactivate()
+        upstream.stop()
+
+    if args.json:
+        json.dump({'args': vars(args), 'results': results}, sys.stdout, indent=2)
+        print()
+        return
+    header = ('step', 'wall_ms', 'http_calls', 'http_kib', 'redis_round_trips', 'announcements', 'replies', 'peak_kib')
+    widths = [max(len(str(row[key])) for row in results + [dict(zip(header, header))]) for key in header]
+    for row in [dict(zip(header, header))] + results:
+        print('  '.join(str(row[key]).ljust(width) for key, width in zip(header, widths)).rstrip() +
+              ('  ' + row['error'] if row.get('error') else ''))
+
+
+if __name__ == '__main__':
+    main()
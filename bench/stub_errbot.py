@@ -0,0 +1,107 @@
+"""Just enough of errbot to load the plugin outside of a bot.
+
+install() registers this module as ``errbot`` so ``import seat`` works. Sent
+messages end up in ``plugin.sent`` and the plugin storage is a plain dict.
+"""
+import contextlib
+import logging
+import sys
+import types
+
+
+class ValidationException(Exception):
+    pass
+
+
+def recurse_check_structure(sample, to_check):
+    """errbot's default configuration check: same types, same keys, list items like the first sample item"""
+    if sample is not None and type(sample) != type(to_check):
+        raise ValidationException('{!r} is not the same type as {!r}'.format(sample, to_check))
+    if isinstance(sample, (list, tuple)):
+        for element in to_check:
+            recurse_check_structure(sample[0], element)
+    elif isinstance(sample, dict):
+        for key in sample:
+            if key not in to_check:
+                raise ValidationException("{!r} doesn't contain the key {}".format(to_check, key))
+        for key in to_check:
+            if key not in sample:
+                raise ValidationException('{!r} contains an unknown key {}'.format(to_check, key))
+        for key in sample:
+            recurse_check_structure(sample[key], to_check[key])
+
+
+class BotPlugin(object):
+    def __init__(self, bot=None, name='seat'):
+        self._storage = {}
+        self.config = None
+        self.sent = []
+        self.log = logging.getLogger(name)
+        self.bot_config = types.SimpleNamespace(BOT_DATA_DIR='.')
+
+    def activate(self):
+        pass
+
+    def deactivate(self):
+        pass
+
+    def configure(self, configuration):
+        self.config = configuration
+
+    def get_configuration_template(self):
+        return None
+
+    def check_configuration(self, configuration):
+        recurse_check_structure(self.get_configuration_template(), configuration)
+
+    def __contains__(self, key):
+        return key in self._storage
+
+    def __getitem__(self, key):
+        return self._storage[key]
+
+    def __setitem__(self, key, value):
+        self._storage[key] = value
+
+    def __delitem__(self, key):
+        del self._storage[key]
+
+    def __iter__(self):
+        return iter(list(self._storage))
+
+    @contextlib.contextmanager
+    def mutable(self, key):
+        value = self._storage[key]
+        yield value
+        self._storage[key] = value
+
+    def start_poller(self, interval, method, times=None, args=None, kwargs=None):
+        pass
+
+    def stop_poller(self, method, args=None, kwargs=None):
+        pass
+
+    def build_identifier(self, text):
+        return text
+
+    def send(self, identifier, text, **kwargs):
+        self.sent.append((identifier, text))
+
+
+def botcmd(*args, **kwargs):
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        args[0]._err_command = True
+        return args[0]
+
+    def decorate(func):
+        func._err_command = True
+        return func
+    return decorate
+
+
+def install():
+    module = types.ModuleType('errbot')
+    module.BotPlugin = BotPlugin
+    module.ValidationException = ValidationException
+    module.botcmd = botcmd
+    sys.modules['errbot'] = module
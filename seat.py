@@ -1,9 +1,1460 @@
-import requests
-from errbot import BotPlugin, botcmd
+import aiohttp
+from errbot import BotPlugin, ValidationException, botcmd
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, namedtuple
+from difflib import get_close_matches
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from urllib.parse import urlsplit
+import asyncio
+import calendar
 import datetime
+import functools
+import heapq
+import inspect
+import json
 import logging
+import os
+import pickle
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+import numpy as np
 import redis
 
+ESI_URL = 'https://esi.evetech.net/latest'
+
+# bump whenever the layout of the warm start file changes, older files are ignored
+WARM_START_VERSION = 3
+
+# starbase states as seat reports them
+STARBASE_STATES = {0: 'unanchored', 1: 'offline', 2: 'onlining', 3: 'reinforced', 4: 'online'}
+
+# contracts and jobs in these states can still change and are watched for updates
+OPEN_CONTRACT_STATES = ('outstanding', 'in_progress')
+OPEN_JOB_STATES = ('active', 'paused', 'ready')
+
+# due deadlines are announced like the poller reports of their stream
+DEADLINE_PREFIXES = {'industry': ':factory: ', 'contracts': ':airplane: ', 'reinf': ''}
+
+# sort keys of !pos and !poco listings, rows are (ticker, starbase/poco)
+STARBASE_SORT_KEYS = {
+    'moon': lambda row: row[1]['moonName'],
+    'system': lambda row: row[1]['solarSystemName'],
+    'corp': lambda row: row[0],
+    'type': lambda row: row[1]['starbaseTypeName'],
+    'fuel': lambda row: row[1]['fuelBlocks'] / row[1]['baseFuelUsage'] if row[1]['baseFuelUsage'] else 0,
+}
+POCO_SORT_KEYS = {
+    'planet': lambda row: row[1]['planetName'],
+    'system': lambda row: row[1]['solarSystemName'],
+    'corp': lambda row: row[0],
+    'type': lambda row: row[1]['planetTypeName'],
+}
+# sort keys of !seat upcoming, rows are Deadlines
+DEADLINE_SORT_KEYS = {
+    'when': lambda deadline: deadline.at,
+    'corp': lambda deadline: deadline.ticker or '',
+    'stream': lambda deadline: deadline.stream,
+}
+
+CONFIG_TEMPLATE = {
+    'SEAT_TOKEN': '<seat_token>',
+    'SEAT_URL': '<your_seat_url>',
+    'FUEL_THRESHOLD': 24,
+    'STRONT_THRESHOLD': 12,
+    'CHECK_STRUCTURES': True,
+    'CHECK_TRADES': True,
+    'CHECK_CONTRACTS': True,
+    'CHECK_INDUSTRY': True,
+    'CORP_ID': '<corpid>',
+    'CORP_IDS': [],
+    'CORP_CHANNELS': {},
+    'REPORT_POS_CHAN': '<channel>',
+    'REPORT_REINF_CHAN': '<channel>',
+    'REPORT_TRADES_CHAN': '<channel>',
+    'REPORT_INDUSTRY_CHAN': '<channel>',
+    'REPORT_CONTRACTS_CHAN': '<channel>',
+    'HTTP_TIMEOUT': 30,
+    'HTTP_POOL_SIZE': 100,
+    'HTTP_HOST_CONCURRENCY': 10,
+    'HTTP_CACHE_SIZE': 1000,
+    'HTTP_CACHE_TTL': 60,
+    'HTTP_RETRIES': 2,
+    'HTTP_BACKOFF': 0.5,
+    'HTTP_BREAKER_FAILURES': 5,
+    'HTTP_BREAKER_COOLDOWN': 60,
+    'POLLER_THREADS': 4,
+    'POLL_FLOOR': 120,
+    'POLL_CEILING': 3600,
+    'STRUCTURE_TTL': 300,
+    'SYNC_MAX_PAGES': 4,
+    'REDIS_HOST': 'localhost',
+    'REDIS_PORT': 6379,
+    'REDIS_DB': 9,
+    'REDIS_MAX_CONNECTIONS': 10,
+    'CLUSTER': False,
+    'LEASE_TTL': 60,
+    'DISPATCH_WINDOW': 5,
+    'MESSAGE_SIZE': 2000,
+    'SEND_RATE': 1,
+    'SEND_BURST': 5,
+    'REPLY_LIMIT': 50,
+    'METRICS_FILE': '',
+    'METRICS_INTERVAL': 60,
+    'METRICS_PORT': 0,
+    'METRICS_HOST': '127.0.0.1',
+    'WARM_START_FILE': 'seat-warm.z',
+    'NAME_CACHE_SIZE': 10000,
+    'NAME_MISSING_TTL': 3600,
+    'NAME_TTL': {
+        'character': 7 * 86400,
+        'type': 30 * 86400,
+        'station': 30 * 86400,
+        'corporation': 86400,
+        'alliance': 86400,
+    },
+}
+
+
+class Metrics(object):
+    """Counters and duration histograms, shown by !seat stats and exported in the prometheus text format"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        # (name, labels) -> [count per bucket..., count, sum, max]
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, labels):
+        # label values are strings, so e.g. 200 and 'cached' statuses sort together
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[self.key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(key, [0] * len(self.BUCKETS) + [0, 0.0, 0.0])
+            i = bisect_left(self.BUCKETS, seconds)
+            if i < len(self.BUCKETS):
+                histogram[i] += 1
+            histogram[-3] += 1
+            histogram[-2] += seconds
+            histogram[-1] = max(histogram[-1], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name):
+        """Returns {labels: value} of a counter"""
+        with self._lock:
+            return {labels: value for (key, labels), value in self.counters.items() if key == name}
+
+    def histogram(self, name):
+        """Returns {labels: (count, sum, max)} of a histogram"""
+        with self._lock:
+            return {labels: tuple(values[-3:]) for (key, labels), values in self.histograms.items() if key == name}
+
+    @staticmethod
+    def labels(labels, **extra):
+        labels = list(labels) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + '}'
+
+    def prometheus(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(values)) for key, values in self.histograms.items())
+        lines = []
+        for name in sorted(set(key[0] for key, _ in counters)):
+            lines.append('# TYPE {} counter'.format(name))
+            lines += ['{}{} {}'.format(name, self.labels(labels), value)
+                      for (key, labels), value in counters if key == name]
+        for name in sorted(set(key[0] for key, _ in histograms)):
+            lines.append('# TYPE {} histogram'.format(name))
+            for (key, labels), values in histograms:
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS, values):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(name, self.labels(labels, le=bound), cumulative))
+                lines.append('{}_bucket{} {}'.format(name, self.labels(labels, le='+Inf'), values[-3]))
+                lines.append('{}_sum{} {}'.format(name, self.labels(labels), values[-2]))
+                lines.append('{}_count{} {}'.format(name, self.labels(labels), values[-3]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Replaces path with the prometheus text, e.g. for node_exporter's textfile collector"""
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.prometheus())
+        os.replace(path + '.tmp', path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serves the prometheus text on host:port/metrics from a daemon thread, returns the server"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='seat-metrics', daemon=True).start()
+        return server
+
+
+def timed(func):
+    """Records the duration of a bot command, generator commands are timed until their last reply"""
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper(self, msg, args):
+            with self.metrics.timer('seat_command_seconds', command=func.__name__):
+                yield from func(self, msg, args)
+    else:
+        @functools.wraps(func)
+        def wrapper(self, msg, args):
+            with self.metrics.timer('seat_command_seconds', command=func.__name__):
+                return func(self, msg, args)
+    return wrapper
+
+
+def endpoint(url):
+    """Reduces a url to host and route for metric labels, ids become {id}"""
+    path = url.split('://', 1)[-1].split('?', 1)[0].rstrip('/')
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+def seat_timestamp(value):
+    """Converts a seat "%Y-%m-%d %H:%M:%S" UTC date to epoch seconds"""
+    return calendar.timegm(time.strptime(value, '%Y-%m-%d %H:%M:%S'))
+
+
+def contract_open(detail, now=None):
+    """Returns whether a contract can still change, esi keeps expired contracts outstanding forever"""
+    if detail['status'] not in OPEN_CONTRACT_STATES:
+        return False
+    now = time.time() if now is None else now
+    return detail['status'] != 'outstanding' or seat_timestamp(detail['date_expired']) > now
+
+
+class NameResolver(object):
+    """Resolves ESI ids to names, looking in a local LRU, then Redis and only then ESI.
+
+    Ids can be queued with want() during a poll cycle, resolve() then looks up
+    everything still missing with a single bulk call to /universe/names/.
+    Ids ESI does not know (e.g. citadels) are stored in Redis as an empty name for
+    missing_ttl seconds, those and ids that could not be looked up at all are not
+    asked for again for RETRY_MISSING seconds.
+    """
+
+    # /universe/names/ category -> kind used for our keys
+    CATEGORIES = {
+        'character': 'character',
+        'inventory_type': 'type',
+        'station': 'station',
+        'corporation': 'corporation',
+        'alliance': 'alliance',
+    }
+    # /universe/names/ accepts at most this many ids per call
+    BATCH_SIZE = 1000
+    # seconds an id that could not be resolved is answered with the default name
+    RETRY_MISSING = 60
+
+    def __init__(self, redis_conn, post, ttls, size=10000, missing_ttl=3600, metrics=None, logger=logging):
+        self.redis = redis_conn
+        self.post = post
+        self.metrics = metrics or Metrics()
+        self.ttls = ttls
+        self.size = size
+        self.missing_ttl = missing_ttl
+        self.logger = logger
+        self._lru = OrderedDict()
+        self._missing = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        # bumped on every newly remembered name
+        self.version = 0
+
+    @staticmethod
+    def key(kind, id):
+        return 'seat:name:{}:{}'.format(kind, id)
+
+    def _remember(self, kind, id, name):
+        with self._lock:
+            self._lru[(kind, id)] = name
+            self._lru.move_to_end((kind, id))
+            self.version += 1
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def entries(self):
+        """Returns the names in the LRU as (kind, id, name), least recently used first"""
+        with self._lock:
+            return [(kind, id, name) for (kind, id), name in self._lru.items()]
+
+    def restore(self, entries):
+        """Fills the LRU with entries() of an earlier run, names resolved since are kept"""
+        with self._lock:
+            for kind, id, name in entries:
+                self._lru.setdefault((kind, id), name)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def _forget(self, keys):
+        """Remembers that keys could not be resolved for a while"""
+        now = time.time()
+        with self._lock:
+            if len(self._missing) > self.size:
+                self._missing = {key: until for key, until in self._missing.items() if until > now}
+            self._missing.update((key, now + self.RETRY_MISSING) for key in keys)
+
+    def missing(self, kind, id):
+        """Returns whether the id recently could not be resolved"""
+        return self._missing.get((kind, int(id)), 0) > time.time()
+
+    def cached(self, kind, id):
+        """Returns the name from the local LRU or None"""
+        with self._lock:
+            name = self._lru.get((kind, int(id)))
+            if name is not None:
+                self._lru.move_to_end((kind, int(id)))
+            return name
+
+    def want(self, kind, id):
+        """Queues an id to be looked up by the next resolve()"""
+        if id is not None and self.cached(kind, id) is None and not self.missing(kind, id):
+            with self._lock:
+                self._pending.add((kind, int(id)))
+
+    def resolve(self):
+        """Resolves all queued ids, using at most one ESI call per 1000 ids"""
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        pending = [(kind, id) for kind, id in pending if self.cached(kind, id) is None]
+        if not pending:
+            return
+
+        self.metrics.inc('seat_redis_round_trips_total', op='names')
+        values = self.redis.mget([self.key(kind, id) for kind, id in pending])
+        missing = []
+        unknown = []
+        for (kind, id), value in zip(pending, values):
+            if value is None:
+                missing.append((kind, id))
+            elif value == b'':
+                unknown.append((kind, id))
+            else:
+                self._remember(kind, id, value.decode('utf-8'))
+        self._forget(unknown)
+        self.metrics.inc('seat_name_lookups_total', len(pending) - len(missing) - len(unknown), source='redis')
+        self.metrics.inc('seat_name_lookups_total', len(unknown), source='missing')
+        if not missing:
+            return
+
+        ids = sorted(set(id for _, id in missing))
+        found = {}
+        for i in range(0, len(ids), self.BATCH_SIZE):
+            found.update(self._fetch(ids[i:i + self.BATCH_SIZE]))
+
+        resolved = {id: entry for id, entry in found.items() if entry is not None}
+        self.metrics.inc('seat_name_lookups_total', len(resolved), source='esi')
+        self.metrics.inc('seat_name_lookups_total', len(ids) - len(resolved), source='failed')
+        self._forget((kind, id) for kind, id in missing if id not in resolved)
+        if not found:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for id, (kind, name) in resolved.items():
+            self._remember(kind, id, name)
+            pipe.set(self.key(kind, id), name, ex=self.ttls.get(kind))
+        for kind, id in missing:
+            if id in found and found[id] is None:
+                # an empty name marks an id esi does not know, never a permanent entry
+                pipe.set(self.key(kind, id), '', ex=self.missing_ttl)
+        self.metrics.inc('seat_redis_round_trips_total', op='names')
+        pipe.execute()
+
+    def _fetch(self, ids):
+        """Posts ids to /universe/names/, splitting the batch if ESI rejects an id in it.
+
+        Returns {id: (kind, name)}, None for ids ESI does not know. Ids missing from the
+        result could not be looked up right now.
+        """
+        try:
+            status, body = self.post(ESI_URL + '/universe/names/', ids)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.info('Could not resolve {} ids from esi: {}'.format(len(ids), e))
+            return {}
+        if status == 404 and len(ids) > 1:
+            # ESI refuses the whole batch if a single id is unknown, e.g. citadels
+            half = len(ids) // 2
+            found = self._fetch(ids[:half])
+            found.update(self._fetch(ids[half:]))
+            return found
+        if status == 404:
+            return {ids[0]: None}
+        if status != 200:
+            self.logger.info('Could not resolve {} ids from esi, got {}'.format(len(ids), status))
+            return {}
+        return {entry['id']: (self.CATEGORIES.get(entry['category'], entry['category']), entry['name'])
+                for entry in body}
+
+    def name(self, kind, id, default='unknown'):
+        """Returns the name for a single id, resolving it and anything queued if needed"""
+        name = self.cached(kind, id)
+        if name is not None:
+            self.metrics.inc('seat_name_lookups_total', source='memory')
+        elif self.missing(kind, id):
+            self.metrics.inc('seat_name_lookups_total', source='missing')
+        else:
+            self.want(kind, id)
+            self.resolve()
+            name = self.cached(kind, id)
+        return name if name is not None else default
+
+
+class StructureIndex(object):
+    """Lookup tables over a tuple of (ticker, row) built once per snapshot.
+
+    Indexes map a key to the positions of the matching rows, so results keep
+    the order seat returned them in.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_system = defaultdict(list)
+        self.by_state = defaultdict(list)
+        for pos, (_, row) in enumerate(rows):
+            self.by_system[row['solarSystemName'].casefold()].append(pos)
+            if 'state' in row:
+                self.by_state[row['state']].append(pos)
+        self.systems = sorted(self.by_system)
+
+    def match_systems(self, name):
+        """Returns the systems matching name exactly, else by prefix, else the closest spellings"""
+        name = name.strip().casefold()
+        if name in self.by_system:
+            return [name]
+        i = bisect_left(self.systems, name)
+        prefixed = []
+        while i < len(self.systems) and self.systems[i].startswith(name):
+            prefixed.append(self.systems[i])
+            i += 1
+        return prefixed or get_close_matches(name, self.systems, n=3, cutoff=0.75)
+
+    def in_system(self, name):
+        positions = []
+        for system in self.match_systems(name):
+            positions += self.by_system[system]
+        return [self.rows[pos] for pos in sorted(positions)]
+
+    def select(self, states):
+        """Returns the rows in any of the given states"""
+        return [self.rows[pos] for pos in sorted(pos for state in states for pos in self.by_state.get(state, ()))]
+
+
+class StarbaseColumns(object):
+    """The numbers of a snapshot's starbases as numpy arrays, element i belongs to starbases[i].
+
+    Dates are parsed to epoch seconds once per snapshot (nan if missing), so checks
+    over the whole fleet are a handful of array operations instead of a python
+    call per tower.
+    """
+
+    def __init__(self, starbases):
+        rows = [row for _, row in starbases]
+
+        def column(field, dtype):
+            return np.fromiter((row[field] for row in rows), dtype=dtype, count=len(rows))
+
+        self.item_id = column('itemID', np.int64)
+        self.state = column('state', np.int8)
+        self.fuel = column('fuelBlocks', np.float64)
+        self.fuel_usage = column('baseFuelUsage', np.float64)
+        self.stront = column('strontium', np.float64)
+        self.stront_usage = column('baseStrontUsage', np.float64)
+        self.updated_at = self.timestamps(rows, 'updated_at')
+        self.state_at = self.timestamps(rows, 'stateTimeStamp')
+        self.position = dict(zip(self.item_id.tolist(), range(len(rows))))
+        # fuel per hour the forecasts use and the observed part of it, see use_burn_rates()
+        self.fuel_burn = self.fuel_usage
+        self.observed_burn = np.full(len(rows), np.nan)
+
+    @staticmethod
+    def timestamps(rows, field):
+        dates = np.array([row.get(field) or 'NaT' for row in rows], dtype='datetime64[s]')
+        seconds = dates.astype(np.int64).astype(np.float64)
+        seconds[np.isnat(dates)] = np.nan
+        return seconds
+
+    @staticmethod
+    def hours(amount, usage):
+        """amount / usage, inf for towers that use none"""
+        return np.divide(amount, usage, out=np.full(len(amount), np.inf), where=usage > 0)
+
+    def use_burn_rates(self, rates):
+        """Forecasts with the observed fuel per hour where rates is not nan"""
+        self.observed_burn = rates
+        self.fuel_burn = np.where(np.isnan(rates), self.fuel_usage, rates)
+
+    def fuel_hours(self):
+        return self.hours(self.fuel, self.fuel_burn)
+
+    def fuel_hours_left(self, now=None):
+        """fuel_hours() less the time since each tower's updated_at, the snapshot lags behind"""
+        now = time.time() if now is None else now
+        elapsed = np.nan_to_num(np.maximum(now - self.updated_at, 0)) / 3600
+        return self.fuel_hours() - elapsed
+
+    def stront_hours(self):
+        return self.hours(self.stront, self.stront_usage)
+
+
+class FuelHistory(object):
+    """Fuel, stront and state samples of every tower in fixed size numpy ring buffers.
+
+    Each tier keeps the last `size` samples of a tower taken at least `step` seconds
+    apart: every sample in the first tier, one per 6 hours in the second and one per
+    day in the third. Recording a snapshot writes one slot per tower and tier, samples
+    whose updated_at is not newer than the tower's last one are skipped.
+    """
+
+    # (step in seconds, size) of every tier
+    TIERS = ((0, 48), (6 * 3600, 28), (86400, 60))
+    # burn rates are observed over this many seconds of samples
+    BURN_WINDOW = 3 * 86400
+    # and need this many hours of the tower online without a refuel
+    BURN_MIN_HOURS = 6
+
+    def __init__(self, tiers=TIERS):
+        self.tiers = tiers
+        self.rows = {}
+        self._free = []
+        self._lock = threading.Lock()
+        # one array per tier, a row per tower
+        self.at = [np.empty((0, size)) for _, size in tiers]
+        self.fuel = [np.empty((0, size), dtype=np.int32) for _, size in tiers]
+        self.stront = [np.empty((0, size), dtype=np.int32) for _, size in tiers]
+        self.states = [np.empty((0, size), dtype=np.int8) for _, size in tiers]
+        # next slot and time of the last sample per tower
+        self.cursor = [np.empty(0, dtype=np.int64) for _ in tiers]
+        self.last = [np.empty(0) for _ in tiers]
+
+    def _allocate(self, capacity):
+        """Grows every buffer to hold capacity towers, new rows are empty"""
+        def grow(array, fill):
+            return np.concatenate([array, np.full((capacity - len(array),) + array.shape[1:], fill, array.dtype)])
+
+        self.at = [grow(array, np.nan) for array in self.at]
+        self.fuel = [grow(array, 0) for array in self.fuel]
+        self.stront = [grow(array, 0) for array in self.stront]
+        self.states = [grow(array, 0) for array in self.states]
+        self.cursor = [grow(array, 0) for array in self.cursor]
+        self.last = [grow(array, -np.inf) for array in self.last]
+
+    def _clear(self, row):
+        for t in range(len(self.tiers)):
+            self.at[t][row] = np.nan
+            self.cursor[t][row] = 0
+            self.last[t][row] = -np.inf
+
+    def record(self, columns):
+        """Adds the samples of a snapshot's StarbaseColumns, towers missing from it lose their history"""
+        with self._lock:
+            for itemID in self.rows.keys() - columns.position.keys():
+                row = self.rows.pop(itemID)
+                self._clear(row)
+                self._free.append(row)
+            for itemID in columns.position.keys() - self.rows.keys():
+                if not self._free:
+                    capacity = len(self.cursor[0])
+                    self._allocate(max(64, capacity * 2))
+                    self._free = list(range(len(self.cursor[0]) - 1, capacity - 1, -1))
+                self.rows[itemID] = self._free.pop()
+            rows = np.fromiter((self.rows[itemID] for itemID in columns.item_id.tolist()), dtype=np.int64,
+                               count=len(columns.item_id))
+            at = columns.updated_at
+            for t, (step, size) in enumerate(self.tiers):
+                last = self.last[t][rows]
+                take = ~np.isnan(at) & (at > last) & (at >= last + step)
+                written, slots = rows[take], self.cursor[t][rows[take]]
+                self.at[t][written, slots] = at[take]
+                self.fuel[t][written, slots] = columns.fuel[take]
+                self.stront[t][written, slots] = columns.stront[take]
+                self.states[t][written, slots] = columns.state[take]
+                self.cursor[t][written] = (slots + 1) % size
+                self.last[t][written] = at[take]
+
+    def samples(self, itemID):
+        """Returns (at, fuel, stront, state) of every kept sample of a tower, newest first"""
+        with self._lock:
+            row = self.rows.get(itemID)
+            if row is None:
+                return []
+            samples = {}
+            for t in range(len(self.tiers)):
+                for sample in zip(self.at[t][row].tolist(), self.fuel[t][row].tolist(),
+                                  self.stront[t][row].tolist(), self.states[t][row].tolist()):
+                    if not np.isnan(sample[0]):
+                        samples[sample[0]] = sample
+        return sorted(samples.values(), reverse=True)
+
+    def burn_rates(self, columns, now=None):
+        """Returns the observed fuel per hour of every tower in columns, nan where it is not known.
+
+        Only pairs of consecutive samples with the tower online at both and no refuel
+        in between count, so refuels and downtime do not skew the rate.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = np.fromiter((self.rows.get(itemID, -1) for itemID in columns.item_id.tolist()), dtype=np.int64,
+                               count=len(columns.item_id))
+            known = rows[rows >= 0]
+            # the fine tier and the 6 hour one, duplicates become pairs of zero length
+            at = np.concatenate([self.at[0][known], self.at[1][known]], axis=1)
+            fuel = np.concatenate([self.fuel[0][known], self.fuel[1][known]], axis=1)
+            state = np.concatenate([self.states[0][known], self.states[1][known]], axis=1)
+        at[at < now - self.BURN_WINDOW] = np.nan
+        order = np.argsort(at, axis=1)
+        at, fuel, state = (np.take_along_axis(array, order, axis=1) for array in (at, fuel, state))
+        hours = np.diff(at, axis=1) / 3600
+        burned = -np.diff(fuel.astype(np.float64), axis=1)
+        online = (state[:, :-1] == 4) & (state[:, 1:] == 4)
+        valid = (hours > 0) & (burned >= 0) & online
+        hours = np.where(valid, hours, 0).sum(axis=1)
+        burned = np.where(valid, burned, 0).sum(axis=1)
+        rates = np.full(len(rows), np.nan)
+        rates[rows >= 0] = np.where((hours >= self.BURN_MIN_HOURS) & (burned > 0),
+                                    burned / np.maximum(hours, 1e-9), np.nan)
+        return rates
+
+    def dump(self):
+        """Returns everything needed to restore() the history, numpy arrays and plain python"""
+        with self._lock:
+            return {'tiers': self.tiers, 'rows': dict(self.rows), 'free': list(self._free),
+                    'arrays': [array.copy() for array in chain(
+                        self.at, self.fuel, self.stront, self.states, self.cursor, self.last)]}
+
+    def restore(self, state):
+        """Takes over the dump() of an earlier run unless its tiers differ"""
+        if tuple(map(tuple, state['tiers'])) != tuple(map(tuple, self.tiers)):
+            return
+        n = len(self.tiers)
+        arrays = state['arrays']
+        with self._lock:
+            self.rows, self._free = dict(state['rows']), list(state['free'])
+            self.at, self.fuel, self.stront, self.states, self.cursor, self.last = (
+                arrays[i * n:(i + 1) * n] for i in range(6))
+
+
+# corps is a tuple of corp dicts, starbases and pocos are tuples of (ticker, row)
+Snapshot = namedtuple('Snapshot', ['fetched_at', 'corps', 'starbases', 'pocos', 'starbase_index', 'poco_index',
+                                   'starbase_columns'])
+
+
+def make_snapshot(fetched_at, corps, starbases, pocos):
+    return Snapshot(fetched_at, corps, starbases, pocos, StructureIndex(starbases), StructureIndex(pocos),
+                    StarbaseColumns(starbases))
+
+
+# result of syncing one corp's stream, key is its cursor and status table name
+StreamSync = namedtuple('StreamSync', ['key', 'corpid', 'ticker', 'last_id', 'rows', 'cursor'])
+
+
+class StructureCache(object):
+    """Keeps the last starbase/poco snapshot and refreshes it once it is older than ttl.
+
+    Concurrent callers of an outdated snapshot wait for a single refresh instead
+    of each fetching it on their own. Callers passing stale_ok, i.e. commands, are
+    answered from the outdated snapshot right away and the refresh is handed to
+    spawn, which runs a function in the background.
+    """
+
+    def __init__(self, fetch, ttl, on_refresh=None, spawn=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.on_refresh = on_refresh
+        self.spawn = spawn
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def fresh(self, snapshot, max_age):
+        return snapshot is not None and time.time() - snapshot.fetched_at < max_age
+
+    def get(self, max_age=None, stale_ok=False):
+        max_age = self.ttl if max_age is None else max_age
+        snapshot = self.snapshot
+        if self.fresh(snapshot, max_age):
+            return snapshot
+        if stale_ok and snapshot is not None and (self.spawn is not None or self._lock.locked()):
+            if not self._lock.locked():
+                self.spawn(self.refresh)
+            return snapshot
+        with self._lock:
+            # someone else may have refreshed it while we waited
+            if not self.fresh(self.snapshot, max_age):
+                previous = self.snapshot
+                self.snapshot = self.fetch(previous)
+                if self.on_refresh is not None:
+                    self.on_refresh(previous, self.snapshot)
+            return self.snapshot
+
+    def refresh(self):
+        """Refreshes the snapshot if it is outdated, for spawn"""
+        self.get()
+
+    def restore(self, snapshot):
+        """Uses snapshot of an earlier run unless one was fetched already, returns whether it was used"""
+        with self._lock:
+            if self.snapshot is not None:
+                return False
+            self.snapshot = snapshot
+            return True
+
+    def invalidate(self):
+        self.snapshot = None
+
+
+class DepletionSchedule(object):
+    """Projected fuel threshold crossings and fuel-out times of all towers.
+
+    Both are computed for the whole fleet at once from the snapshot's columns.
+    Crossings sit in a min-heap that due() pops, fuel-out times are kept sorted so
+    "who runs dry in the next n hours" is a binary search.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._heap = []
+        self._deadlines = {}
+        self._out = {}
+        self._rows = ()
+        self._position = {}
+        self._empty_at = np.empty(0)
+        self._empty_pos = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def update(self, snapshot, now=None):
+        now = time.time() if now is None else now
+        columns = snapshot.starbase_columns
+        hours_left = columns.fuel_hours()
+        burning = np.flatnonzero((columns.state != 1) & (columns.fuel_usage > 0) & ~np.isnan(columns.updated_at))
+        out = columns.updated_at + hours_left * 3600
+        # check_fuel truncates, so it triggers once less than threshold + 1 hours are left
+        crossing = columns.updated_at + (hours_left - self.threshold - 1) * 3600
+        # the snapshot lags behind, crossings already passed are due right away, towers
+        # out of fuel are left to the regular pos check
+        upcoming = burning[out[burning] > now]
+        deadlines = dict(zip(columns.item_id[upcoming].tolist(), crossing[upcoming].tolist()))
+        heap = [(at, itemID) for itemID, at in deadlines.items()]
+        heapq.heapify(heap)
+        order = burning[np.argsort(out[burning], kind='stable')]
+        with self._lock:
+            self._heap = heap
+            self._deadlines = deadlines
+            self._out = dict(zip(columns.item_id[upcoming].tolist(), out[upcoming].tolist()))
+            self._rows = snapshot.starbases
+            self._position = columns.position
+            self._empty_at = out[order]
+            self._empty_pos = order
+
+    def next_deadline(self):
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due(self, now=None):
+        """Pops and returns (hours left, ticker, starbase) of every tower that crossed the threshold by now"""
+        now = time.time() if now is None else now
+        result = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                crossing, itemID = heapq.heappop(self._heap)
+                if self._deadlines.get(itemID) == crossing:
+                    del self._deadlines[itemID]
+                    result.append((max(0, self._out[itemID] - now) / 3600,) + self._rows[self._position[itemID]])
+        return result
+
+    def running_out(self, hours, now=None):
+        """Returns (hours left, ticker, starbase) of towers whose fuel runs out within hours"""
+        now = time.time() if now is None else now
+        with self._lock:
+            empty_at, empty_pos, rows = self._empty_at, self._empty_pos, self._rows
+        start, end = np.searchsorted(empty_at, [now, now + hours * 3600])
+        return [((out - now) / 3600,) + rows[pos]
+                for out, pos in zip(empty_at[start:end].tolist(), empty_pos[start:end].tolist())]
+
+
+# a known future event of stream, announced once it is due
+Deadline = namedtuple('Deadline', ['at', 'stream', 'corpid', 'ticker', 'text'])
+
+
+class DeadlineSchedule(object):
+    """Known future events: industry jobs ending, towers leaving reinforcement, couriers expiring.
+
+    Deadlines come in groups (e.g. 'industry:<corpid>' or 'pos') and a group is
+    replaced as a whole whenever a poll or snapshot shows its current state. They
+    sit in a min-heap that due() pops, replaced entries are skipped once they reach
+    the top and the heap is rebuilt when they make up most of it.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._groups = {}
+        self._lock = threading.Lock()
+        # bumped whenever a group changed
+        self.version = 0
+
+    def _valid(self, entry):
+        deadline = self._deadlines.get(entry[1:])
+        return deadline is not None and deadline.at == entry[0]
+
+    def replace(self, group, deadlines, now=None):
+        """Makes deadlines, {key: Deadline}, the only ones of group, returns whether that changed anything"""
+        now = time.time() if now is None else now
+        # past deadlines were announced already or happened while nobody watched
+        upcoming = {key: deadline for key, deadline in deadlines.items() if deadline.at > now}
+        with self._lock:
+            current = {key: self._deadlines[(group, key)] for key in self._groups.get(group, ())}
+            if upcoming == current:
+                return False
+            for key in current:
+                del self._deadlines[(group, key)]
+            self._groups[group] = set(upcoming)
+            for key, deadline in upcoming.items():
+                self._deadlines[(group, key)] = deadline
+                heapq.heappush(self._heap, (deadline.at, group, key))
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(deadline.at,) + entry for entry, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+            self.version += 1
+            return True
+
+    def groups(self):
+        """Returns {group: {key: Deadline}} of everything still to come"""
+        with self._lock:
+            return {group: {key: self._deadlines[(group, key)] for key in keys}
+                    for group, keys in self._groups.items()}
+
+    def next_deadline(self):
+        with self._lock:
+            while self._heap and not self._valid(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due(self, now=None):
+        """Pops and returns (group, Deadline) of everything due by now"""
+        now = time.time() if now is None else now
+        result = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._valid(entry):
+                    result.append((entry[1], self._deadlines.pop(entry[1:])))
+                    self._groups[entry[1]].discard(entry[2])
+        return result
+
+    def upcoming(self, seconds, now=None):
+        """Returns the Deadlines of the next seconds, soonest first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            deadlines = [deadline for deadline in self._deadlines.values() if now < deadline.at <= now + seconds]
+        return sorted(deadlines, key=lambda deadline: deadline.at)
+
+
+class PollPlan(object):
+    """Decides when a stream is polled next.
+
+    The interval halves (down to floor) after a poll that found changes and grows by
+    half (up to ceiling) after one that did not. There is no point in polling before
+    the upstream response expires, but a known deadline, e.g. a job ending or a tower
+    leaving reinforcement, pulls the next poll forward to just after it.
+    """
+
+    # seat lags behind the game, poll this many seconds after a deadline
+    SLACK = 60
+
+    def __init__(self, interval, floor, ceiling):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.interval = min(max(interval, floor), ceiling)
+        self.last = time.time()
+        self.expires = None
+        self.deadlines = []
+        self._lock = threading.Lock()
+
+    def record(self, changed, expires=None, deadlines=None, now=None):
+        """Called after every poll, deadlines are epoch seconds and kept as they are if None"""
+        with self._lock:
+            self.last = time.time() if now is None else now
+            if changed:
+                self.interval = max(self.floor, self.interval / 2)
+            else:
+                self.interval = min(self.ceiling, self.interval * 1.5)
+            self.expires = expires
+            if deadlines is not None:
+                self.deadlines = sorted(deadlines)
+
+    def skip(self, now=None):
+        """Called instead of record() when another instance polled the stream"""
+        with self._lock:
+            self.last = time.time() if now is None else now
+
+    def next_poll(self):
+        """Returns the epoch time of the next poll"""
+        with self._lock:
+            at = self.last + self.interval
+            if self.expires is not None:
+                at = min(max(at, self.expires), self.last + self.ceiling)
+            # the first deadline the last poll could not have seen yet
+            i = bisect_left(self.deadlines, self.last - self.SLACK)
+            if i < len(self.deadlines):
+                at = min(at, self.deadlines[i] + self.SLACK)
+            return max(at, self.last + self.floor)
+
+    def delay(self):
+        """Seconds until the next poll, for PollerEngine.schedule"""
+        return self.next_poll() - time.time()
+
+
+class PollerEngine(object):
+    """Runs pollers, timers and upstream requests on one asyncio loop in a background thread.
+
+    Pollers are plain functions run on a small thread pool, as they talk to redis
+    and the errbot storage. Their http requests go back to the loop through run(),
+    so any number of them can be in flight without a thread each.
+    """
+
+    def __init__(self, threads=4, logger=logging):
+        self.logger = logger
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='seat-poller')
+        self.tasks = {}
+        self.wakers = {}
+        self._thread = threading.Thread(target=self._run_loop, name='seat-engine', daemon=True)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.run(shutdown(), timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.executor.shutdown(wait=False)
+        self.loop.close()
+
+    def run(self, coro, timeout=None):
+        """Runs coro on the loop and waits for its result, must not be called from the loop thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def schedule(self, name, interval, func):
+        """Runs func every interval seconds, the first time after one interval like errbot's pollers.
+
+        interval may be a function returning the seconds until the next run, it is asked
+        again after every run and whenever wake(name) is called.
+        """
+        self.tasks[name] = asyncio.run_coroutine_threadsafe(self._every(name, interval, func), self.loop)
+
+    def wake(self, name):
+        """Makes a scheduled task recompute its delay, e.g. after its deadlines changed"""
+        if name in self.wakers:
+            self.loop.call_soon_threadsafe(self.wakers[name].set)
+
+    async def _every(self, name, interval, func):
+        wake = self.wakers[name] = asyncio.Event()
+        while True:
+            wake.clear()
+            delay = interval() if callable(interval) else interval
+            try:
+                await asyncio.wait_for(wake.wait(), max(0, delay))
+                continue
+            except asyncio.TimeoutError:
+                pass
+            await self._call(name, func)
+
+    async def _call(self, name, func):
+        try:
+            await self.loop.run_in_executor(self.executor, func)
+        except Exception:
+            self.logger.exception('{} failed'.format(name))
+
+    def call_at(self, when, func):
+        """Runs func on the pool at epoch time when, returns a future whose cancel() stops it"""
+        async def at():
+            await asyncio.sleep(max(0, when - time.time()))
+            await self._call(func.__name__, func)
+
+        return asyncio.run_coroutine_threadsafe(at(), self.loop)
+
+
+# a cached GET response, expires is in epoch seconds
+CachedResponse = namedtuple('CachedResponse', ['etag', 'expires', 'body'])
+
+
+class UpstreamUnavailable(aiohttp.ClientError):
+    """Raised instead of sending a request to a host whose breaker is open or that throttles us for long"""
+
+
+class UpstreamClient(object):
+    """aiohttp session shared by seat and esi requests, lives on the PollerEngine loop.
+
+    GET responses are kept in an LRU of cache_size urls. Until a response expires
+    (Expires or Cache-Control max-age, default_ttl seconds if neither is sent) it is
+    returned without a request, afterwards it is revalidated with If-None-Match and
+    a 304 returns the cached body without downloading or decoding it again.
+    Cached bodies are shared, callers must not modify them.
+
+    Connection errors, timeouts and RETRY_STATUSES are retried up to retries times
+    with jittered exponential backoff, or after Retry-After if the host sent one.
+    A host that answered 429/420 or whose ESI error limit runs low is not asked
+    again until it allows it, and breaker_failures failures in a row open its
+    breaker for breaker_cooldown seconds. Both fail fast with UpstreamUnavailable
+    instead of stalling the pollers.
+    """
+
+    # 420 is ESI's error limit, 429 seat's api throttle
+    RETRY_STATUSES = (420, 429, 500, 502, 503, 504)
+    # hold back requests to an ESI host once fewer errors than this are left in its window
+    ERROR_LIMIT_FLOOR = 10
+
+    def __init__(self, timeout, pool_size, per_host, cache_size=1000, default_ttl=0, retries=2, backoff=0.5,
+                 breaker_failures=5, breaker_cooldown=60, metrics=None, logger=logging):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.cache_size = cache_size
+        self.default_ttl = default_ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.metrics = metrics or Metrics()
+        self.logger = logger
+        self.cache = OrderedDict()
+        self.expiries = {}
+        # per host: epoch seconds it throttles us until, failures in a row, breaker open until
+        self.throttled = {}
+        self.failures = defaultdict(int)
+        self.broken = {}
+        self.session = None
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host),
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        await self.session.close()
+
+    def expires(self, headers, now):
+        """Returns when a response with these headers goes stale, in epoch seconds"""
+        for directive in headers.get('Cache-Control', '').split(','):
+            name, _, value = directive.strip().partition('=')
+            if name == 'max-age' and value.isdigit():
+                return now + int(value)
+        try:
+            expires = parsedate_to_datetime(headers['Expires']).timestamp()
+            # relative to the server's clock, ours may be off
+            date = parsedate_to_datetime(headers['Date']).timestamp() if 'Date' in headers else now
+        except (KeyError, TypeError, ValueError):
+            return now + self.default_ttl
+        return now + expires - date
+
+    def cached(self, url):
+        entry = self.cache.get(url)
+        if entry is not None:
+            self.cache.move_to_end(url)
+        return entry
+
+    def store(self, url, entry):
+        self.cache[url] = entry
+        self.cache.move_to_end(url)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.expiries[endpoint(url)] = entry.expires
+
+    def expiry(self, url):
+        """Returns when the last cached response of url's endpoint expires or None"""
+        return self.expiries.get(endpoint(url))
+
+    async def entries(self):
+        """Returns the cache as (url, etag, expires, body), least recently used first"""
+        return [(url,) + tuple(entry) for url, entry in self.cache.items()]
+
+    async def restore(self, entries):
+        """Fills the cache with entries() of an earlier run, responses cached since are kept"""
+        for url, etag, expires, body in entries:
+            if url not in self.cache:
+                self.store(url, CachedResponse(etag, expires, body))
+
+    @staticmethod
+    def retry_after(headers, now):
+        """Returns the seconds a Retry-After header asks for or None"""
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            return int(value)
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+
+    def throttle(self, host, seconds):
+        self.throttled[host] = max(self.throttled.get(host, 0), time.time() + seconds)
+
+    def failed(self, host):
+        self.failures[host] += 1
+        if self.failures[host] >= self.breaker_failures:
+            if host not in self.broken:
+                self.logger.warning('{} failed {} times in a row, pausing requests for {}s'.format(
+                    host, self.failures[host], self.breaker_cooldown))
+            self.broken[host] = time.time() + self.breaker_cooldown
+
+    def succeeded(self, host):
+        self.failures.pop(host, None)
+        self.broken.pop(host, None)
+
+    async def admit(self, host, url):
+        """Waits until host may be asked again, raises UpstreamUnavailable if that takes too long"""
+        now = time.time()
+        if self.broken.get(host, 0) > now:
+            self.metrics.inc('seat_upstream_requests_total', endpoint=endpoint(url), status='unavailable')
+            raise UpstreamUnavailable('{} is unavailable for {:.0f}s'.format(host, self.broken[host] - now))
+        if host in self.broken:
+            # half open, this request tries the host again while everyone else keeps waiting
+            self.broken[host] = now + self.breaker_cooldown
+        wait = self.throttled.get(host, 0) - now
+        if wait > self.timeout:
+            self.metrics.inc('seat_upstream_requests_total', endpoint=endpoint(url), status='unavailable')
+            raise UpstreamUnavailable('{} throttles requests for {:.0f}s'.format(host, wait))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def request(self, method, url, headers=None, json=None):
+        """Returns (status, decoded json body or None), a GET answered from the cache returns 200"""
+        entry = self.cached(url) if method == 'GET' else None
+        if entry is not None and entry.expires > time.time():
+            self.metrics.inc('seat_upstream_requests_total', endpoint=endpoint(url), status='cached')
+            return 200, entry.body
+        if entry is not None and entry.etag:
+            headers = dict(headers or {}, **{'If-None-Match': entry.etag})
+
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await self.admit(host, url)
+            try:
+                status, body = await self.attempt(method, url, headers, json, entry, host)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.failed(host)
+                if attempt == self.retries:
+                    raise
+            else:
+                if status not in self.RETRY_STATUSES:
+                    self.succeeded(host)
+                    return status, body
+                if status >= 500:
+                    self.failed(host)
+                if attempt == self.retries:
+                    return status, body
+            if self.throttled.get(host, 0) <= time.time():
+                # full jitter, so pollers that failed together do not retry together, a throttling
+                # host is waited for by admit()
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def attempt(self, method, url, headers, json, entry, host):
+        """Sends one request, returns (status, body) and notes how long the host wants us to wait"""
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            async with self.session.request(method, url, headers=headers, json=json) as r:
+                status = r.status
+                now = time.time()
+                remain = r.headers.get('X-ESI-Error-Limit-Remain', '')
+                reset = r.headers.get('X-ESI-Error-Limit-Reset', '')
+                if remain.isdigit() and reset.isdigit() and (int(remain) < self.ERROR_LIMIT_FLOOR or r.status == 420):
+                    self.logger.warning('{} has {} errors left, pausing requests for {}s'.format(host, remain, reset))
+                    self.throttle(host, int(reset))
+                delay = self.retry_after(r.headers, now) if r.status in self.RETRY_STATUSES else None
+                if delay is not None or r.status in (420, 429):
+                    self.throttle(host, delay if delay is not None else self.backoff)
+                if r.status == 304 and entry is not None:
+                    self.store(url, entry._replace(expires=self.expires(r.headers, now)))
+                    return 200, entry.body
+                body = await r.json(content_type=None) if r.status == 200 else None
+                if r.status == 200 and method == 'GET':
+                    entry = CachedResponse(r.headers.get('ETag'), self.expires(r.headers, time.time()), body)
+                    if entry.etag or entry.expires > time.time():
+                        self.store(url, entry)
+                return r.status, body
+        finally:
+            self.metrics.observe('seat_upstream_seconds', time.perf_counter() - started, endpoint=endpoint(url))
+            self.metrics.inc('seat_upstream_requests_total', endpoint=endpoint(url), status=status)
+
+
+class TokenBucket(object):
+    """Allows rate messages per second on average and bursts of up to burst messages"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def delay(self):
+        """Takes a token and returns how long to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0, -self.tokens / self.rate)
+
+
+def chunk_lines(lines, size):
+    """Packs lines into as few texts of at most size characters as possible"""
+    chunks = []
+    current = ''
+    for line in lines:
+        while len(line) > size:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:size])
+            line = line[size:]
+        if current and len(current) + 1 + len(line) > size:
+            chunks.append(current)
+            current = ''
+        current = current + '\n' + line if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def format_table(headers, rows):
+    """Renders rows of strings as a monospaced table in a code block"""
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    lines = ['  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip()
+             for row in [headers] + list(rows)]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '```\n' + '\n'.join(lines) + '\n```'
+
+
+class Dispatcher(object):
+    """Queues announcements per channel and sends them as rate limited digests.
+
+    Everything enqueued for a channel within window seconds of its first queued
+    message goes out together, packed into messages of at most size characters.
+    """
+
+    def __init__(self, send, build_identifier, window, size, rate, burst, metrics=None, logger=logging):
+        self.send = send
+        self.metrics = metrics or Metrics()
+        self.build_identifier = build_identifier
+        self.window = window
+        self.size = size
+        self.bucket = TokenBucket(rate, burst)
+        self.logger = logger
+        self.identifiers = {}
+        self.queues = OrderedDict()
+        self.stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self.run, name='seat-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, flush=True):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        if flush:
+            for channel, (_, lines) in self.queues.items():
+                self.deliver(channel, lines)
+            self.queues.clear()
+
+    def enqueue(self, channel, text):
+        with self._cond:
+            if channel not in self.queues:
+                self.queues[channel] = (time.monotonic(), [])
+                self._cond.notify()
+            self.queues[channel][1].append(text)
+        self.metrics.inc('seat_announcements_total', channel=channel)
+
+    def identifier(self, channel):
+        if channel not in self.identifiers:
+            self.identifiers[channel] = self.build_identifier(channel)
+        return self.identifiers[channel]
+
+    def deliver(self, channel, lines):
+        for chunk in chunk_lines(lines, self.size):
+            time.sleep(self.bucket.delay())
+            try:
+                self.send(self.identifier(channel), chunk)
+                self.metrics.inc('seat_messages_sent_total', channel=channel)
+            except Exception as e:
+                self.logger.error('Could not send to {}: {}'.format(channel, e))
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self.stopped:
+                    now = time.monotonic()
+                    due = [channel for channel, (since, _) in self.queues.items() if since + self.window <= now]
+                    if due:
+                        break
+                    waits = [since + self.window - now for since, _ in self.queues.values()]
+                    self._cond.wait(min(waits) if waits else None)
+                if self.stopped:
+                    return
+                ready = [(channel, self.queues.pop(channel)[1]) for channel in due]
+            for channel, lines in ready:
+                self.deliver(channel, lines)
+
+
+class Coordinator(object):
+    """Shares the pollers of several bot instances through redis.
+
+    Every stream is polled by the one instance holding its lease, a redis key that
+    expires unless its owner renews it. Reports of the leaders are appended to a
+    redis stream that the other instances read and announce in their own channels.
+    """
+
+    # take the lease if it is free, extend it if we hold it
+    HOLD = """
+        local owner = redis.call('get', KEYS[1])
+        if owner == false or owner == ARGV[1] then
+            redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+            return 1
+        end
+        return 0
+    """
+    RELEASE = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    EVENTS = 'seat:events'
+
+    def __init__(self, redis_conn, streams, ttl, receive, metrics=None, logger=logging):
+        self.redis = redis_conn
+        self.streams = streams
+        self.ttl = ttl
+        self.receive = receive
+        self.metrics = metrics or Metrics()
+        self.logger = logger
+        self.owner = uuid.uuid4().hex
+        self.held = set()
+        self.stopped = False
+        self._hold = redis_conn.register_script(self.HOLD)
+        self._release = redis_conn.register_script(self.RELEASE)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.run, name='seat-coordinator', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self._thread.join(timeout=5)
+        pipe = self.redis.pipeline(transaction=False)
+        for stream in self.held:
+            self._release(keys=['seat:lease:' + stream], args=[self.owner], client=pipe)
+        pipe.execute()
+        self.held = set()
+
+    def leads(self, stream):
+        return stream in self.held
+
+    def renew(self):
+        """Takes or extends the lease of every stream, returns the streams that were just taken over"""
+        pipe = self.redis.pipeline(transaction=False)
+        for stream in self.streams:
+            self._hold(keys=['seat:lease:' + stream], args=[self.owner, int(self.ttl * 1000)], client=pipe)
+        self.metrics.inc('seat_redis_round_trips_total', op='leases')
+        held = set(stream for stream, ok in zip(self.streams, pipe.execute()) if ok)
+        taken, self.held = held - self.held, held
+        return taken
+
+    def publish(self, kind, **fields):
+        """Queues an event for the other instances, sent by the next flush()"""
+        with self._lock:
+            self._pending.append(dict(fields, kind=kind, owner=self.owner))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for event in pending:
+            pipe.xadd(self.EVENTS, {'event': json.dumps(event)}, maxlen=10000, approximate=True)
+        self.metrics.inc('seat_redis_round_trips_total', op='events')
+        pipe.execute()
+
+    def run(self):
+        last = '$'
+        while not self.stopped:
+            try:
+                entries = self.redis.xread({self.EVENTS: last}, block=1000)
+            except redis.RedisError as e:
+                self.logger.error('Could not read events: {}'.format(e))
+                time.sleep(1)
+                continue
+            for _, messages in entries or ():
+                for id, fields in messages:
+                    last = id
+                    event = json.loads(fields[b'event'].decode('utf-8'))
+                    if event['owner'] != self.owner:
+                        try:
+                            self.receive(event)
+                        except Exception:
+                            self.logger.exception('Could not handle event {}'.format(event))
+
 
 class Seat(BotPlugin):
     """Seat API to errbot"""
@@ -13,48 +1464,294 @@ class Seat(BotPlugin):
         self.logger = logging
         self.seat_headers = {
             'X-Token': self.config['SEAT_TOKEN'], 'Accept': 'application/json'}
-
+        self.metrics = Metrics()
+        self.engine = PollerEngine(self.config['POLLER_THREADS'], self.logger)
+        self.engine.start()
+        self.http = UpstreamClient(
+            self.config['HTTP_TIMEOUT'], self.config['HTTP_POOL_SIZE'], self.config['HTTP_HOST_CONCURRENCY'],
+            self.config['HTTP_CACHE_SIZE'], self.config['HTTP_CACHE_TTL'], self.config['HTTP_RETRIES'],
+            self.config['HTTP_BACKOFF'], self.config['HTTP_BREAKER_FAILURES'], self.config['HTTP_BREAKER_COOLDOWN'],
+            self.metrics, self.logger)
+        self.engine.run(self.http.open())
+        self.dispatcher = Dispatcher(
+            self.send, self.build_identifier, self.config['DISPATCH_WINDOW'], self.config['MESSAGE_SIZE'],
+            self.config['SEND_RATE'], self.config['SEND_BURST'], self.metrics, self.logger)
+        self.dispatcher.start()
+        self.structures = StructureCache(
+            self.fetch_shared_structures, self.config['STRUCTURE_TTL'], self.on_structures,
+            lambda func: self.engine.call_at(0, func))
+        self.depletion = DepletionSchedule(self.config['FUEL_THRESHOLD'])
+        self.depletion_timer = None
+        self.deadlines = DeadlineSchedule()
+        self.deadline_timer = None
+        self.history = FuelHistory()
+
+        if 'warnings' not in self:
+            # warning states used to be stored as one shelf entry per tower
+            self['warnings'] = {key: self[key] for key in self if isinstance(self[key], dict)}
+            for key in self['warnings']:
+                del self[key]
+        self.warnings_lock = threading.Lock()
+        # the stream pollers run concurrently and each rewrites the cursors entry
+        self.cursors_lock = threading.Lock()
+        if 'cursors' not in self:
+            # older versions only kept the last seen id of each stream
+            self['cursors'] = {
+                stream: {'last_id': self[key] if key in self else 1, 'page': 0}
+                for stream, key in (('trades', 'last_trade_id'), ('contracts', 'last_contract_id'),
+                                    ('industry', 'last_job_id'))}
+            for key in ('last_trade_id', 'last_contract_id', 'last_job_id'):
+                if key in self:
+                    del self[key]
+        legacy = [stream for stream in ('trades', 'contracts', 'industry') if stream in self['cursors']]
+
+        self.redis = redis.StrictRedis(connection_pool=redis.ConnectionPool(
+            host=self.config['REDIS_HOST'], port=self.config['REDIS_PORT'], db=self.config['REDIS_DB'],
+            max_connections=self.config['REDIS_MAX_CONNECTIONS']))
+        self.names = NameResolver(
+            self.redis, self.esi_post, self.config['NAME_TTL'], self.config['NAME_CACHE_SIZE'],
+            self.config['NAME_MISSING_TTL'], self.metrics, self.logger)
+        if legacy:
+            # cursors and statuses used to exist once for CORP_ID only
+            cursors = self['cursors']
+            for stream in legacy:
+                key = '{}:{}'.format(stream, self.config['CORP_ID'])
+                cursors[key] = cursors.pop(stream)
+                if stream != 'trades' and self.redis.exists('seat:status:' + stream):
+                    self.redis.renamenx('seat:status:' + stream, 'seat:status:' + key)
+            self['cursors'] = cursors
+
+        self.coordinator = None
+        if self.config['CLUSTER']:
+            # the first instance seeds the shared state from its shelf
+            self.redis.set('seat:state:warnings', json.dumps(self['warnings']), nx=True)
+            if self.redis.type('seat:state:cursors') == b'string':
+                # cursors used to be a single json string, rewritten by every leader
+                cursors = json.loads(self.redis.get('seat:state:cursors').decode('utf-8'))
+                pipe = self.redis.pipeline()
+                pipe.delete('seat:state:cursors')
+                for key, cursor in cursors.items():
+                    pipe.hset('seat:state:cursors', key, json.dumps(cursor))
+                pipe.execute()
+            pipe = self.redis.pipeline()
+            for key, cursor in self['cursors'].items():
+                pipe.hsetnx('seat:state:cursors', key, json.dumps(cursor))
+            pipe.execute()
+            self.coordinator = Coordinator(
+                self.redis, ['pos', 'trades', 'contracts', 'industry'], self.config['LEASE_TTL'],
+                self.on_event, self.metrics, self.logger)
+            self.coordinator.renew()
+            self.coordinator.start()
+            self.engine.schedule('leases', self.config['LEASE_TTL'] / 3, self.renew_leases)
+
+        self.plans = {
+            stream: PollPlan(interval, self.config['POLL_FLOOR'], self.config['POLL_CEILING'])
+            for stream, interval in (('pos', 3600), ('trades', 900), ('contracts', 900), ('industry', 900))}
         if self.config['CHECK_STRUCTURES']:
-            self.start_poller(3600, self._poller_pos_check)
-            self.start_poller(3600, self._poller_pos_clear_warnings)
+            self.engine.schedule(
+                'pos', self.plans['pos'].delay, self.stream_poller('pos', self._poller_pos_check))
         if self.config['CHECK_TRADES']:
-            self.start_poller(900, self._poller_transactions_check)
+            self.engine.schedule(
+                'trades', self.plans['trades'].delay, self.stream_poller('trades', self._poller_transactions_check))
         if self.config['CHECK_CONTRACTS']:
-            self.start_poller(900, self._poller_contracts_check)
+            self.engine.schedule(
+                'contracts', self.plans['contracts'].delay,
+                self.stream_poller('contracts', self._poller_contracts_check))
         if self.config['CHECK_INDUSTRY']:
-            self.start_poller(900, self._poller_industry_check)
-        if 'last_trade_id' not in self:
-            self['last_trade_id'] = 1
-        if 'last_contract_id' not in self:
-            self['last_contract_id'] = 1
-        if 'last_job_id' not in self:
-            self['last_job_id'] = 1
-
-        self.redis = redis.StrictRedis(host='localhost', port=6379, db=9)
+            self.engine.schedule(
+                'industry', self.plans['industry'].delay, self.stream_poller('industry', self._poller_industry_check))
+        if self.config['METRICS_FILE']:
+            self.engine.schedule('metrics', self.config['METRICS_INTERVAL'],
+                                 lambda: self.metrics.write(self.config['METRICS_FILE']))
+        self.metrics_server = None
+        if self.config['METRICS_PORT']:
+            self.metrics_server = self.metrics.serve(self.config['METRICS_PORT'], self.config['METRICS_HOST'])
+        self.warm_lock = threading.Lock()
+        self.warm_version = None
+        self.refresh_requested = 0
+        self.engine.call_at(0, self.warm_start)
+
+    def deactivate(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        self.save_warm_start()
+        self.engine.run(self.http.close())
+        self.engine.stop()
+        if self.coordinator is not None:
+            self.coordinator.stop()
+        self.dispatcher.stop()
+        super(Seat, self).deactivate()
 
     ####################################################################################################################
     # Configuration
 
     def get_configuration_template(self):
-        return {
-            'SEAT_TOKEN': '<seat_token>',
-            'SEAT_URL': '<your_seat_url>',
-            'FUEL_THRESHOLD': 24,
-            'STRONT_THRESHOLD': 12,
-            'CHECK_STRUCTURES': True,
-            'CHECK_TRADES': True,
-            'CHECK_CONTRACTS': True,
-            'CHECK_INDUSTRY': True,
-            'CORP_ID': '<corpid>',
-            'REPORT_POS_CHAN': '<channel>',
-            'REPORT_REINF_CHAN': '<channel>',
-            'REPORT_TRADES_CHAN': '<channel>',
-            'REPORT_INDUSTRY_CHAN': '<channel>',
-            'REPORT_CONTRACTS_CHAN': '<channel>'
-        }
+        return CONFIG_TEMPLATE
+
+    def configure(self, configuration):
+        if configuration is not None and configuration != {}:
+            config = dict(chain(CONFIG_TEMPLATE.items(), configuration.items()))
+            # NAME_TTL may only name the kinds whose ttl differs from the default
+            config['NAME_TTL'] = dict(CONFIG_TEMPLATE['NAME_TTL'], **config['NAME_TTL'])
+        else:
+            config = CONFIG_TEMPLATE
+        super(Seat, self).configure(config)
+
+    def check_configuration(self, configuration):
+        # allow partial configs, missing keys fall back to the template
+        config = dict(chain(CONFIG_TEMPLATE.items(), configuration.items()))
+
+        def is_number(value):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+        def is_corp_id(value):
+            return isinstance(value, int) and not isinstance(value, bool) or isinstance(value, str) and value.isdigit()
+
+        # errbot's check wants the exact types and keys of the template, the keys below are more lenient
+        if not (is_corp_id(config['CORP_ID']) or config['CORP_ID'] == CONFIG_TEMPLATE['CORP_ID']):
+            raise ValidationException('CORP_ID must be a corp id, not {!r}'.format(config['CORP_ID']))
+        ids = config['CORP_IDS']
+        if ids != 'all' and not (isinstance(ids, (list, tuple)) and all(is_corp_id(corpid) for corpid in ids)):
+            raise ValidationException("CORP_IDS must be a list of corp ids or 'all', not {!r}".format(ids))
+        streams = {key[len('REPORT_'):-len('_CHAN')].lower() for key in CONFIG_TEMPLATE if key.startswith('REPORT_')}
+        channels = config['CORP_CHANNELS']
+        if not isinstance(channels, dict):
+            raise ValidationException('CORP_CHANNELS must map corp ids to channels, not {!r}'.format(channels))
+        for corpid, channel in channels.items():
+            if not is_corp_id(corpid) or not (isinstance(channel, str) or isinstance(channel, dict) and all(
+                    stream in streams and isinstance(name, str) for stream, name in channel.items())):
+                raise ValidationException('CORP_CHANNELS maps a corp id to a channel or to {{stream: channel}} '
+                                          'with a stream of {}, not {!r}: {!r}'.format(
+                                              ', '.join(sorted(streams)), corpid, channel))
+        ttls = config['NAME_TTL']
+        if not isinstance(ttls, dict) or not all(
+                kind in CONFIG_TEMPLATE['NAME_TTL'] and is_number(ttl) for kind, ttl in ttls.items()):
+            raise ValidationException('NAME_TTL must map some of {} to seconds, not {!r}'.format(
+                ', '.join(sorted(CONFIG_TEMPLATE['NAME_TTL'])), ttls))
+        for key, default in CONFIG_TEMPLATE.items():
+            if is_number(default) and not is_number(config[key]):
+                raise ValidationException('{} must be a number, not {!r}'.format(key, config[key]))
+
+        lenient = {'CORP_ID', 'CORP_IDS', 'CORP_CHANNELS', 'NAME_TTL'}
+        super(Seat, self).check_configuration({
+            key: CONFIG_TEMPLATE[key] if key in lenient or is_number(CONFIG_TEMPLATE.get(key)) else value
+            for key, value in config.items()})
 
     ####################################################################################################################
     # Helper
+    def stream_poller(self, stream, func):
+        """Wraps the poller of stream, it is timed and only runs on the instance leading stream"""
+        timed_func = self.timed_poller(stream, func)
+
+        def poller():
+            plan = self.plans[stream]
+            polled = plan.last
+            try:
+                if self.coordinator is None:
+                    timed_func()
+                elif self.coordinator.leads(stream):
+                    timed_func()
+                    self.coordinator.flush()
+                else:
+                    plan.skip()
+            finally:
+                # a poll failing before record_poll() would otherwise be due again right away
+                if plan.last == polled:
+                    plan.record(False)
+            self.save_warm_start()
+        poller.__name__ = func.__name__
+        return poller
+
+    def timed_poller(self, name, func):
+        """Wraps a poller so its runs are recorded in seat_poller_seconds"""
+        def poller():
+            with self.metrics.timer('seat_poller_seconds', poller=name):
+                func()
+        poller.__name__ = func.__name__
+        return poller
+
+    def announce(self, channel, text):
+        """Queues text for channel, see Dispatcher"""
+        self.dispatcher.enqueue(channel, text)
+
+    def report(self, stream, text, corpid=None):
+        """Announces text where this instance reports stream and passes it on to the other instances"""
+        self.announce(self.report_channel(stream, corpid), text)
+        if self.coordinator is not None:
+            self.coordinator.publish('report', stream=stream, corpid=corpid, text=text)
+
+    def load_state(self, name):
+        """Returns the warnings, from redis if they are shared between instances"""
+        if self.coordinator is None:
+            return self[name]
+        self.metrics.inc('seat_redis_round_trips_total', op='state')
+        return json.loads(self.redis.get('seat:state:' + name).decode('utf-8'))
+
+    def save_state(self, name, value):
+        if self.coordinator is None:
+            self[name] = value
+            return
+        self.metrics.inc('seat_redis_round_trips_total', op='state')
+        self.redis.set('seat:state:' + name, json.dumps(value))
+
+    def parse_listing(self, args, sort_keys):
+        """Splits args into words and --limit/--page/--sort options, returns None if an option is invalid"""
+        words = []
+        options = {'limit': self.config['REPLY_LIMIT'], 'page': 1, 'sort': None}
+        tokens = args.split()
+        while tokens:
+            token = tokens.pop(0)
+            if not token.startswith('--'):
+                words.append(token)
+                continue
+            name, _, value = token[2:].partition('=')
+            if not value and tokens:
+                value = tokens.pop(0)
+            if name not in options:
+                return None
+            if name == 'sort':
+                if value.lstrip('-') not in sort_keys:
+                    return None
+                options['sort'] = value
+            elif value.isdigit() and int(value) > 0:
+                options[name] = int(value)
+            else:
+                return None
+        return words, options
+
+    def paged(self, rows, options, sort_keys):
+        """Sorts rows and cuts out the requested page, returns (rows, page, pages, total)"""
+        if options['sort']:
+            rows = sorted(rows, key=sort_keys[options['sort'].lstrip('-')],
+                          reverse=options['sort'].startswith('-'))
+        limit = options['limit']
+        pages = max(1, -(-len(rows) // limit))
+        page = min(options['page'], pages)
+        return rows[(page - 1) * limit:page * limit], page, pages, len(rows)
+
+    def render_tables(self, headers, rows, page=1, pages=1, total=None):
+        """Yields rows as tables, packing as many rows into each message as MESSAGE_SIZE allows.
+
+        rows may be a generator, every message is yielded as soon as it is full.
+        """
+        size = self.config['MESSAGE_SIZE']
+        footer = 'Page {}/{} of {} results, use --page for more'.format(page, pages, total) if pages > 1 else ''
+        chunk = []
+        for row in rows:
+            if chunk and len(format_table(headers, chunk + [row])) > size:
+                yield format_table(headers, chunk)
+                chunk = []
+            chunk.append(row)
+        if chunk:
+            text = format_table(headers, chunk)
+            if footer and len(text) + len(footer) + 1 <= size:
+                yield text + '\n' + footer
+                return
+            yield text
+        if footer:
+            yield footer
+
     def strfdelta(self, tdelta, fmt):
         d = {"days": tdelta.days}
         d["hours"], rem = divmod(tdelta.seconds, 3600)
@@ -64,90 +1761,54 @@ class Seat(BotPlugin):
     ####################################################################################################################
     # ESI api Calls
 
-    def get_or_set(self, key, value):
-        if self.redis.get(key):
-            return self.redis.get(key).decode('utf-8')
-        self.redis.set(key, value)
-        return self.redis.get(key).decode('utf-8')
-
     def get_pilot(self, id):
-        try:
-            r = requests.get(
-                'https://esi.evetech.net/latest/characters/{}'.format(str(id)))
-            r.raise_for_status()
-            value = r.json()['name']
-            return self.get_or_set(str(id), value)
-
-        except requests.exceptions.RequestException as e:
-            self.logger.info(
-                'Got a connection reset error from esi interface: {}'.format(e))
-            return 'unknown'
+        return self.names.name('character', id)
 
     def get_item(self, id):
-        try:
-            r = requests.get(
-                'https://esi.evetech.net/latest/universe/types/{}'.format(str(id)))
-            r.raise_for_status()
-            value = r.json()['name']
-            return self.get_or_set(str(id), value)
-
-        except requests.exceptions.RequestException as e:
-            self.logger.info(
-                'Got a connection reset error from esi interface: {}'.format(e))
-            return 'unknown'
+        return self.names.name('type', id)
 
     def get_corporation(self, id):
-        try:
-            r = requests.get(
-                'https://esi.evetech.net/latest/corporations/{}'.format(str(id)))
-            r.raise_for_status()
-            value = r.json()['name']
-            return self.get_or_set(str(id), value)
-
-        except requests.exceptions.RequestException as e:
-            self.logger.info(
-                'Got a connection reset error from esi interface: {}'.format(e))
-            return 'unknown'
+        return self.names.name('corporation', id)
 
     def get_alliance(self, id):
-        try:
-            r = requests.get(
-                'https://esi.evetech.net/latest/alliances/{}'.format(str(id)))
-            r.raise_for_status()
-            value = r.json()['name']
-            return self.get_or_set(str(id), value)
-
-        except requests.exceptions.RequestException as e:
-            self.logger.info(
-                'Got a connection reset error from esi interface: {}'.format(e))
-            return 'unknown'
+        return self.names.name('alliance', id)
 
     def get_station_name(self, id):
-        try:
-            r = requests.get(
-                'https://esi.evetech.net/latest/universe/stations/{}'.format(str(id)))
-            r.raise_for_status()
-            value = r.json()['name']
-            return self.get_or_set(str(id), value)
+        return self.names.name('station', id, 'unknown Station')
 
-        except requests.exceptions.RequestException as e:
-            self.logger.info(
-                'Got a connection reset error from esi interface: {}'.format(e))
-            return 'unknown Station'
+    def want_job_names(self, jobs):
+        """Resolves installer, facility and blueprint names of all jobs in one go"""
+        for job in jobs:
+            self.names.want('character', job['installer_id'])
+            self.names.want('station', job['facility_id'])
+            self.names.want('type', job['blueprint_type_id'])
+        self.names.resolve()
 
     ####################################################################################################################
     # Seat Api Calls
 
-    def api_call(self, url):
+    async def api_get(self, url):
         try:
-            r = requests.get(url, headers=self.seat_headers)
-            if r.status_code == requests.codes.ok:
-                return r.json()
-            else:
-                self.logger.error(
-                    "Problem with status code for %s got %s" % (url, r.status_code))
-        except requests.exceptions.ConnectionError as e:
-            self.logger.error('Got a connection reset error:' + e)
+            status, body = await self.http.request('GET', url, headers=self.seat_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error('Got a connection error for {}: {}'.format(url, e))
+            return None
+        if status == 200:
+            return body
+        self.logger.error(
+            "Problem with status code for %s got %s" % (url, status))
+
+    def api_call(self, url):
+        return self.engine.run(self.api_get(url))
+
+    def api_calls(self, urls):
+        """Requests all urls at once, returns their bodies in the same order (None for failures)"""
+        async def gather():
+            return await asyncio.gather(*[self.api_get(url) for url in urls])
+        return self.engine.run(gather())
+
+    def esi_post(self, url, body):
+        return self.engine.run(self.http.request('POST', url, json=body))
 
     def get_corps(self):
         url = self.config['SEAT_URL'] + "/corporation/all"
@@ -166,121 +1827,619 @@ class Seat(BotPlugin):
               "/corporation/starbases/" + str(corpid) + "/" + str(posid)
         return self.api_call(url)
 
+    def fetch_structures(self, previous=None):
+        """Fetches starbases and pocos of all corps in parallel into a new Snapshot.
+
+        If a corp can not be fetched its rows from the previous snapshot are kept.
+        """
+        corps = self.get_corps()
+        if corps is None:
+            if previous is None:
+                raise RuntimeError('Could not fetch corporations from seat')
+            corps = previous.corps
+        responses = self.api_calls(
+            [self.config['SEAT_URL'] + "/corporation/starbases/" + str(corp['corporationID']) for corp in corps] +
+            [self.config['SEAT_URL'] + "/corporation/pocos/" + str(corp['corporationID']) for corp in corps])
+        starbases, pocos = responses[:len(corps)], responses[len(corps):]
+
+        def rows(responses, kind):
+            result = []
+            for corp, corp_rows in zip(corps, responses):
+                if corp_rows is None and previous is not None:
+                    corp_rows = [row for ticker, row in getattr(previous, kind) if ticker == corp['ticker']]
+                result += [(corp['ticker'], row) for row in corp_rows or []]
+            return tuple(result)
+
+        return make_snapshot(time.time(), tuple(corps), rows(starbases, 'starbases'), rows(pocos, 'pocos'))
+
+    def get_pages(self, url, pages=4):
+        """Returns the rows of the last <pages> pages of a paginated seat route.
+
+        The first page tells us how many pages there are, the remaining ones are
+        fetched in parallel and its own rows are reused if it is in the range.
+        Returns None if one of the pages could not be fetched.
+        """
+        first = self.api_call(url)
+        if first is None:
+            return None
+        totalPages = first['meta']['last_page']
+        startPage = max(1, totalPages - pages + 1)
+        rest = self.api_calls([url + '?page=' + str(i) for i in range(max(2, startPage), totalPages + 1)])
+        if any(items is None for items in rest):
+            return None
+        # the response bodies are cached, collect into a new list
+        allItems = list(first['data']) if startPage == 1 else []
+        for items in rest:
+            allItems += items['data']
+        return allItems
+
+    async def fetch_pages(self, url, numbers):
+        """Fetches the given page numbers in parallel, returns {page: rows} or None if one failed"""
+        responses = await asyncio.gather(*[self.api_get(url + '?page=' + str(i)) for i in numbers])
+        if any(response is None for response in responses):
+            return None
+        return {i: response['data'] for i, response in zip(numbers, responses)}
+
+    async def sync_pages(self, url, cursor, id_field, is_open=None):
+        """Fetches the pages of a paginated seat route that can hold rows we have not handled yet.
+
+        cursor is {'last_id': newest id handled, 'page': first page to read, 0 if unknown,
+        'last_page': page count of the last sync if any}. Rows are expected in ascending id
+        order. Reading starts at the cursor's page and walks back as far as needed if the rows
+        before it were never seen, so a burst of any size is read completely. Without a known
+        page only the last SYNC_MAX_PAGES pages are read, the first request goes to where they
+        started last time (page 1 if never synced) and its rows are kept if still in range.
+
+        Returns (rows, new cursor) or None if seat could not be reached. The new cursor
+        points at the oldest page holding a row is_open() wants to keep watching.
+        """
+        last_id, page = cursor['last_id'], cursor['page']
+        window = self.config['SYNC_MAX_PAGES']
+        probe = page or max(1, cursor.get('last_page', 1) - window + 1)
+        first = await self.api_get(url + '?page=' + str(probe))
+        if first is None:
+            return None
+        totalPages = first['meta']['last_page']
+        pages = {probe: first['data']}
+
+        start = min(page, totalPages) if page else max(1, totalPages - window + 1)
+        fetched = await self.fetch_pages(url, [i for i in range(start, totalPages + 1) if i not in pages])
+        if fetched is None:
+            return None
+        pages.update(fetched)
+        # backfill while everything on the oldest page read is newer than the cursor
+        while page and start > 1 and pages[start] and min(row[id_field] for row in pages[start]) > last_id:
+            numbers = list(range(max(1, start - self.config['HTTP_HOST_CONCURRENCY']), start))
+            fetched = await self.fetch_pages(url, numbers)
+            if fetched is None:
+                return None
+            pages.update(fetched)
+            start = numbers[0]
+
+        rows = []
+        watched = []
+        newest, newest_page = last_id, totalPages
+        for i in range(start, totalPages + 1):
+            for row in pages.get(i, []):
+                rows.append(row)
+                if row[id_field] > newest:
+                    newest, newest_page = row[id_field], i
+                if is_open is not None and is_open(row):
+                    watched.append(i)
+        return rows, {'last_id': newest, 'page': min(watched + [newest_page]), 'last_page': totalPages}
+
+    def monitored_corps(self):
+        """Returns (corpid, ticker) of the corps whose trades, contracts and jobs are polled.
+
+        CORP_IDS is a list of corp ids or 'all' for every corp in seat, if it is empty
+        only CORP_ID is polled. Tickers are only looked up when there are several corps.
+        """
+        ids = self.config['CORP_IDS'] or [self.config['CORP_ID']]
+        if ids != 'all' and len(ids) == 1:
+            return [(ids[0], None)]
+        corps = self.get_corps()
+        if corps is None and self.structures.snapshot is not None:
+            corps = self.structures.snapshot.corps
+        if ids == 'all':
+            return [(corp['corporationID'], corp['ticker']) for corp in corps or ()]
+        tickers = {str(corp['corporationID']): corp['ticker'] for corp in corps or ()}
+        return [(corpid, tickers.get(str(corpid), str(corpid))) for corpid in ids]
+
+    def stream_url(self, route, corpid=None):
+        return self.config['SEAT_URL'] + route + str(self.config['CORP_ID'] if corpid is None else corpid)
+
+    def report_channel(self, stream, corpid):
+        """Returns where to report stream of corpid, CORP_CHANNELS can map a corp to a channel
+        or to {stream: channel}, anything missing goes to the REPORT_<STREAM>_CHAN channel"""
+        channels = self.config['CORP_CHANNELS']
+        channel = channels.get(corpid, channels.get(str(corpid)))
+        if isinstance(channel, dict):
+            channel = channel.get(stream)
+        return channel or self.config['REPORT_{}_CHAN'.format(stream.upper())]
+
+    def sync_stream(self, stream, route, id_field, is_open=None):
+        """Runs sync_pages for every monitored corp at once, each from its own cursor.
+
+        Returns a StreamSync of every corp that could be read, so a poll takes as long
+        as the slowest corp and one unreachable corp does not hold back the others.
+        """
+        corps = self.monitored_corps()
+        cursors = self.load_cursors()
+        keys = ['{}:{}'.format(stream, corpid) for corpid, _ in corps]
+        starts = [cursors.get(key, {'last_id': 1, 'page': 0}) for key in keys]
+
+        async def gather():
+            return await asyncio.gather(*[
+                self.sync_pages(self.stream_url(route, corpid), cursor, id_field, is_open)
+                for (corpid, _), cursor in zip(corps, starts)], return_exceptions=True)
+
+        synced = []
+        for key, (corpid, ticker), cursor, result in zip(keys, corps, starts, self.engine.run(gather())):
+            if isinstance(result, Exception):
+                self.logger.error('Could not sync {}: {!r}'.format(key, result))
+            elif result is not None:
+                synced.append(StreamSync(key, corpid, ticker, cursor['last_id'], result[0], result[1]))
+        return synced
+
+    def load_cursors(self):
+        """Returns the cursors of all streams and corps, from redis if they are shared between instances"""
+        if self.coordinator is None:
+            return self['cursors']
+        self.metrics.inc('seat_redis_round_trips_total', op='state')
+        return {key.decode('utf-8'): json.loads(value.decode('utf-8'))
+                for key, value in self.redis.hgetall('seat:state:cursors').items()}
+
+    def save_cursors(self, updates):
+        """Stores the cursors of several corps with one shelf write.
+
+        In a cluster every cursor is a field of its own, so instances leading
+        different streams do not overwrite each other's cursors.
+        """
+        if not updates:
+            return
+        if self.coordinator is not None:
+            self.metrics.inc('seat_redis_round_trips_total', op='state')
+            self.redis.hset('seat:state:cursors', mapping={key: json.dumps(cursor) for key, cursor in updates.items()})
+            return
+        with self.cursors_lock:
+            cursors = self['cursors']
+            cursors.update(updates)
+            self['cursors'] = cursors
+
     def get_transactions(self, corpid):
         url = self.config['SEAT_URL'] + \
               "/corporation/wallet-transactions/" + str(corpid)
-        # get 3 last pages for buying sprees
-        allItems = []
-        totalPages = self.api_call(url)['meta']['last_page']
-        startPage = totalPages - 3 if not totalPages < 4 else 0
-        for i in range(startPage, totalPages + 1):
-            items = self.api_call(url + '?page=' + str(i))['data']
-            allItems += items
-        return allItems
+        # get last pages for buying sprees
+        return self.get_pages(url)
 
     def get_contracts(self, corpid):
         url = self.config['SEAT_URL'] + \
               "/corporation/contracts/" + str(corpid)
-        allContracts = []
-        totalPages = self.api_call(url)['meta']['last_page']
-        startPage = totalPages - 3 if not totalPages < 4 else 0
-        for i in range(startPage, totalPages + 1):
-            contracts = self.api_call(url + '?page=' + str(i))['data']
-            allContracts += contracts
-        return allContracts
+        return self.get_pages(url)
 
     def get_industry(self, corpid):
         url = self.config['SEAT_URL'] + \
               "/corporation/industry/" + str(corpid)
-        allJobs = []
-        totalPages = self.api_call(url)['meta']['last_page']
-        startPage = totalPages - 3 if not totalPages < 4 else 0
-        for i in range(startPage, totalPages + 1):
-            jobs = self.api_call(url + '?page=' + str(i))['data']
-            allJobs += jobs
-        return allJobs
+        return self.get_pages(url)
 
     ####################################################################################################################
     # Reporting states
 
     def set_warning(self, itemid, warn_type, enabled=True):
         """Sets warning states to given itemid"""
-        itemid = str(itemid)
-        if itemid not in self:
-            self[itemid] = {}
-        with self.mutable(itemid) as d:
-            d[warn_type] = enabled
+        with self.warnings_lock:
+            warnings = self.load_state('warnings')
+            warnings.setdefault(str(itemid), {})[warn_type] = enabled
+            self.save_state('warnings', warnings)
 
     def check_warning(self, itemid, warning):
         """Checks warning state for given itemid. If none present returns True"""
-        itemid = str(itemid)
-        if itemid in self:
-            if warning in self[itemid]:
-                return self[itemid][warning]
-        else:
+        return self.load_state('warnings').get(str(itemid), {}).get(warning, True)
+
+    def claim_warning(self, itemid, warn_type):
+        """Disables an armed warning, returns False if it was already reported"""
+        with self.warnings_lock:
+            if not self.check_warning(itemid, warn_type):
+                return False
+            warnings = self.load_state('warnings')
+            warnings.setdefault(str(itemid), {})[warn_type] = False
+            self.save_state('warnings', warnings)
             return True
 
+    def evaluate_warnings(self, previous, snapshot, warnings):
+        """Runs all checks on every tower of snapshot in one pass.
+
+        Returns the new warning states and (ticker, starbase, message) for every
+        warning that has to be reported. A warning is reported once and armed
+        again as soon as its check passes. Towers that were in the previous
+        snapshot but are gone now lose their states.
+        """
+        columns = snapshot.starbase_columns
+        fuel_hours = columns.fuel_hours_left()
+        checks = (
+            ('warn_outdated', self.check_outdated(columns),
+             lambda ticker, starbase: '%s %s %s is outdated.' % (
+                 ticker, starbase['moonName'], starbase['starbaseTypeName'])),
+            ('warn_fuel', self.check_fuel(columns),
+             lambda ticker, starbase: '%s %s %s  will run out of fuel in %s hours' % (
+                 ticker, starbase['moonName'], starbase['starbaseTypeName'],
+                 round(fuel_hours[columns.position[starbase['itemID']]]))),
+            ('warn_reinforced', self.check_reinforced(columns),
+             lambda ticker, starbase: '%s %s %s got reinforced, Timer %s' % (
+                 ticker, starbase['moonName'], starbase['starbaseTypeName'], starbase['stateTimeStamp'])),
+            ('warn_stront', self.check_stront(columns),
+             lambda ticker, starbase: '%s %s %s has only stront for %s hours' % (
+                 ticker, starbase['moonName'], starbase['starbaseTypeName'],
+                 round(starbase['strontium'] / starbase['baseStrontUsage']))),
+        )
+        # only towers failing a check or with a reported warning can change state
+        failing = np.zeros(len(snapshot.starbases), dtype=bool)
+        for _, mask, _ in checks:
+            failing |= mask
+        positions = set(np.flatnonzero(failing).tolist())
+        positions.update(columns.position[int(itemid)] for itemid in warnings
+                         if itemid.isdigit() and int(itemid) in columns.position)
+        result = dict(warnings)
+        reports = []
+        for pos in sorted(positions):
+            ticker, starbase = snapshot.starbases[pos]
+            itemid = str(starbase['itemID'])
+            states = dict(warnings.get(itemid, {}))
+            for warn_type, mask, message in checks:
+                armed = states.get(warn_type, True)
+                if mask[pos]:
+                    if armed:
+                        states[warn_type] = False
+                        reports.append((ticker, starbase, message(ticker, starbase)))
+                elif not armed:
+                    states[warn_type] = True
+                    self.logger.info("Reenabled {} on {}".format(warn_type, starbase['moonName']))
+            result[itemid] = states
+        if previous is not None:
+            for itemID in previous.starbase_columns.position.keys() - columns.position.keys():
+                result.pop(str(itemID), None)
+        return result, reports
+
+    def load_statuses(self, stream, ids):
+        """Returns the last known status of every id in one round trip, None for unknown ids"""
+        if not ids:
+            return {}
+        self.metrics.inc('seat_redis_round_trips_total', op='statuses')
+        values = self.redis.hmget('seat:status:' + stream, ids)
+        return {id: value.decode('utf-8') if value is not None else None for id, value in zip(ids, values)}
+
+    def store_statuses(self, stream, statuses, closed=()):
+        """Writes changed statuses and forgets closed ids in one transaction"""
+        if not statuses and not closed:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        if statuses:
+            pipe.hset('seat:status:' + stream, mapping=statuses)
+        if closed:
+            pipe.hdel('seat:status:' + stream, *closed)
+        self.metrics.inc('seat_redis_round_trips_total', op='statuses')
+        pipe.execute()
+
     ####################################################################################################################
     # Checks
 
-    def check_fuel(self, starbase):
-        if starbase['state'] == 1:
-            return False
-        fuel_left = starbase['fuelBlocks'] / starbase['baseFuelUsage']
-        if int(fuel_left) <= self.config['FUEL_THRESHOLD']:
-            return True
-        else:
-            return False
+    # every check takes a snapshot's StarbaseColumns and returns a mask of the towers failing it
+
+    def check_fuel(self, columns):
+        return (columns.state != 1) & (np.trunc(columns.fuel_hours_left()) <= self.config['FUEL_THRESHOLD'])
 
-    def check_outdated(self, starbase):
+    def check_outdated(self, columns):
         # last_updated does not change on reinforced or anchored/offline pos
-        if starbase['state'] == 1 or starbase['state'] == 3:
-            return False
+        return (columns.state != 1) & (columns.state != 3) & (columns.updated_at < time.time() - 12 * 3600)
 
-        last_update = datetime.datetime.strptime(
-            starbase['updated_at'], "%Y-%m-%d %H:%M:%S")
-        if last_update < datetime.datetime.utcnow() - datetime.timedelta(hours=12):
-            return True
-        else:
-            return False
+    def check_stront(self, columns):
+        return ((columns.state != 1) & (columns.state != 3) &
+                (np.trunc(columns.stront_hours()) <= self.config['STRONT_THRESHOLD']))
 
-    def check_stront(self, starbase):
-        if starbase['state'] == 1 or starbase['state'] == 3:
-            return False
-        stront_left = starbase['strontium'] / starbase['baseStrontUsage']
-        if int(stront_left) <= self.config['STRONT_THRESHOLD']:
-            return True
-        else:
-            return False
+    def check_reinforced(self, columns):
+        return columns.state == 3
 
-    def check_reinforced(self, starbase):
-        if starbase['state'] == 3:
-            return True
-        else:
-            return False
+    ####################################################################################################################
+    # Snapshot updates
+
+    def on_structures(self, previous, snapshot):
+        """Called with every new starbase snapshot"""
+        self.record_history(snapshot)
+        self.depletion.update(snapshot)
+        self.update_reinforcement_deadlines(snapshot)
+        if self.coordinator is not None and not self.coordinator.leads('pos'):
+            # the leader reports warnings, followers only answer commands from it
+            return
+        with self.warnings_lock:
+            warnings, reports = self.evaluate_warnings(previous, snapshot, self.load_state('warnings'))
+            # one shelf write for all towers
+            self.save_state('warnings', warnings)
+        for ticker, starbase, message in reports:
+            self.logger.info("Reported warning on {}: {}".format(starbase['moonName'], message))
+            self.report('pos', message)
+        self.arm_depletion_timer()
+        if self.coordinator is not None:
+            self.share_snapshot(snapshot)
+            self.coordinator.flush()
+
+        columns = snapshot.starbase_columns
+        changed = bool(reports) or previous is None or not (
+            np.array_equal(columns.item_id, previous.starbase_columns.item_id) and
+            np.array_equal(columns.state, previous.starbase_columns.state))
+        timers = columns.state_at[self.check_reinforced(columns)]
+        deadlines = timers[~np.isnan(timers)].tolist()
+        if self.depletion.next_deadline() is not None:
+            deadlines.append(self.depletion.next_deadline())
+        self.record_poll('pos', changed, self.stream_url('/corporation/starbases/'), deadlines)
+
+    def record_history(self, snapshot):
+        """Adds the samples of snapshot to the fuel history and forecasts with the observed burn rates"""
+        columns = snapshot.starbase_columns
+        self.history.record(columns)
+        columns.use_burn_rates(self.history.burn_rates(columns))
+
+    def share_snapshot(self, snapshot):
+        """Stores the snapshot for the other instances and lets them know"""
+        self.metrics.inc('seat_redis_round_trips_total', op='snapshot')
+        self.redis.set('seat:snapshot', json.dumps({
+            'fetched_at': snapshot.fetched_at, 'corps': snapshot.corps,
+            'starbases': snapshot.starbases, 'pocos': snapshot.pocos}))
+        self.coordinator.publish('snapshot')
+
+    def load_shared_snapshot(self):
+        """Returns the snapshot the pos leader stored last or None"""
+        self.metrics.inc('seat_redis_round_trips_total', op='snapshot')
+        value = self.redis.get('seat:snapshot')
+        if value is None:
+            return None
+        data = json.loads(value.decode('utf-8'))
+        return make_snapshot(data['fetched_at'], tuple(data['corps']),
+                             tuple(tuple(row) for row in data['starbases']), tuple(tuple(row) for row in data['pocos']))
+
+    def fetch_shared_structures(self, previous=None):
+        """Fetches a new snapshot, followers never ask seat but use the leader's one.
+
+        A follower whose shared snapshot is outdated asks the leader for a new one and
+        goes on with the outdated one meanwhile. Before the leader shared any it waits
+        up to HTTP_TIMEOUT seconds for the first.
+        """
+        if self.coordinator is None or self.coordinator.leads('pos'):
+            return self.fetch_structures(previous)
+        snapshot = self.load_shared_snapshot()
+        now = time.time()
+        if (snapshot is None or now - snapshot.fetched_at >= self.config['STRUCTURE_TTL']) and \
+                now - self.refresh_requested >= self.config['HTTP_TIMEOUT']:
+            self.refresh_requested = now
+            self.coordinator.publish('refresh')
+            self.coordinator.flush()
+        deadline = now + self.config['HTTP_TIMEOUT']
+        while snapshot is None and time.time() < deadline:
+            time.sleep(1)
+            snapshot = self.load_shared_snapshot()
+        if snapshot is None:
+            raise RuntimeError('The pos leader has not shared a snapshot yet')
+        return snapshot
+
+    def on_event(self, event):
+        """Handles what the leader of a stream published"""
+        if event['kind'] == 'report':
+            self.announce(self.report_channel(event['stream'], event['corpid']), event['text'])
+        elif event['kind'] == 'snapshot':
+            snapshot = self.load_shared_snapshot()
+            if snapshot is not None:
+                self.structures.snapshot = snapshot
+                self.record_history(snapshot)
+                self.depletion.update(snapshot)
+                self.update_reinforcement_deadlines(snapshot)
+        elif event['kind'] == 'refresh':
+            if self.coordinator.leads('pos'):
+                self.engine.call_at(0, self.structures.refresh)
+        elif event['kind'] == 'deadlines':
+            self.deadlines.replace(event['group'], {key: Deadline(*deadline) for key, *deadline in event['deadlines']})
+            self.arm_deadline_timer()
+
+    def renew_leases(self):
+        for stream in self.coordinator.renew():
+            self.logger.info('Took over polling {}'.format(stream))
+            if stream == 'pos':
+                self.arm_depletion_timer()
+            self.engine.wake(stream)
+
+    def record_poll(self, stream, changed, url, deadlines=None):
+        """Feeds the outcome of a poll into the stream's PollPlan and reschedules it"""
+        self.plans[stream].record(changed, self.http.expiry(url), deadlines)
+        self.engine.wake(stream)
+
+    def arm_depletion_timer(self):
+        """Wakes up at the next projected fuel threshold crossing"""
+        if self.depletion_timer is not None:
+            self.depletion_timer.cancel()
+        deadline = self.depletion.next_deadline()
+        if deadline is None:
+            self.depletion_timer = None
+            return
+        self.depletion_timer = self.engine.call_at(deadline, self._depletion_alerts)
+
+    def _depletion_alerts(self):
+        if self.coordinator is not None and not self.coordinator.leads('pos'):
+            return
+        for hours, ticker, starbase in self.depletion.due():
+            if self.claim_warning(starbase['itemID'], 'warn_fuel'):
+                self.logger.info(
+                    "Reported projected fuel warning on {}".format(starbase['moonName']))
+                self.report('pos', '%s %s %s  will run out of fuel in %s hours' % (
+                    ticker, starbase['moonName'], starbase['starbaseTypeName'], int(hours)))
+        if self.coordinator is not None:
+            self.coordinator.flush()
+        self.arm_depletion_timer()
+
+    def update_reinforcement_deadlines(self, snapshot):
+        """Replaces the deadlines of towers leaving reinforcement with those of snapshot"""
+        columns = snapshot.starbase_columns
+        corpids = {corp['ticker']: corp['corporationID'] for corp in snapshot.corps}
+        reinforced = np.flatnonzero(self.check_reinforced(columns) & ~np.isnan(columns.state_at))
+        deadlines = {}
+        for pos, at in zip(reinforced.tolist(), columns.state_at[reinforced].tolist()):
+            ticker, starbase = snapshot.starbases[pos]
+            deadlines[starbase['itemID']] = Deadline(
+                at, 'reinf', corpids.get(ticker), ticker,
+                '%s %s leaves reinforcement' % (starbase['moonName'], starbase['starbaseTypeName']))
+        self.replace_deadlines('pos', deadlines)
+
+    def replace_deadlines(self, group, deadlines):
+        """Replaces the deadlines of group, passes them on to the other instances and wakes up for the next one"""
+        if not self.deadlines.replace(group, deadlines):
+            return
+        # followers build the 'pos' group from the shared snapshot themselves
+        if self.coordinator is not None and group != 'pos' and self.coordinator.leads(group.split(':')[0]):
+            self.coordinator.publish('deadlines', group=group, deadlines=[
+                [key] + list(deadline) for key, deadline in deadlines.items()])
+        self.arm_deadline_timer()
+
+    def arm_deadline_timer(self):
+        """Wakes up at the next known deadline"""
+        if self.deadline_timer is not None:
+            self.deadline_timer.cancel()
+        deadline = self.deadlines.next_deadline()
+        if deadline is None:
+            self.deadline_timer = None
+            return
+        self.deadline_timer = self.engine.call_at(deadline, self._deadline_alerts)
+
+    def _deadline_alerts(self):
+        # every instance drops due deadlines, the leader of their stream announces them
+        for group, deadline in self.deadlines.due():
+            if self.coordinator is None or self.coordinator.leads(group.split(':')[0]):
+                tag = '[{}] '.format(deadline.ticker) if deadline.ticker else ''
+                self.logger.info('Reached deadline: {}'.format(deadline.text))
+                self.report(deadline.stream, DEADLINE_PREFIXES[deadline.stream] + tag + deadline.text, deadline.corpid)
+        if self.coordinator is not None:
+            self.coordinator.flush()
+        self.arm_deadline_timer()
+
+    ####################################################################################################################
+    # Warm start
+
+    def warm_start_path(self):
+        path = self.config['WARM_START_FILE']
+        return os.path.join(self.bot_config.BOT_DATA_DIR, path) if path else None
+
+    def save_warm_start(self):
+        """Writes the snapshot, resolved names, deadlines and cached responses to WARM_START_FILE.
+
+        Nothing is written while neither the snapshot, the names nor the deadlines changed since
+        the last write.
+        """
+        path = self.warm_start_path()
+        snapshot = self.structures.snapshot
+        version = (snapshot.fetched_at if snapshot is not None else None, self.names.version, self.deadlines.version)
+        if path is None or version == self.warm_version:
+            return
+        # plain tuples only, so the file does not depend on the plugin's module name
+        if snapshot is not None:
+            snapshot = (snapshot.fetched_at, snapshot.corps, snapshot.starbases, snapshot.pocos)
+        state = {
+            'version': WARM_START_VERSION,
+            'snapshot': snapshot,
+            'names': self.names.entries(),
+            'history': self.history.dump(),
+            # the 'pos' group is rebuilt from the snapshot
+            'deadlines': {group: {key: tuple(deadline) for key, deadline in deadlines.items()}
+                          for group, deadlines in self.deadlines.groups().items() if group != 'pos'},
+            'responses': self.engine.run(self.http.entries()),
+        }
+        with self.warm_lock:
+            try:
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1))
+                os.replace(path + '.tmp', path)
+            except OSError as e:
+                self.logger.warning('Could not write warm start file {}: {}'.format(path, e))
+                return
+            self.warm_version = version
+
+    def load_warm_start(self):
+        """Returns what save_warm_start wrote last or None"""
+        path = self.warm_start_path()
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, EOFError, ValueError, zlib.error, pickle.UnpicklingError) as e:
+            self.logger.warning('Ignoring warm start file {}: {}'.format(path, e))
+            return None
+        return state if state.get('version') == WARM_START_VERSION else None
+
+    def warm_start(self):
+        """Restores the state of the last run, then refreshes the snapshot if it is outdated.
+
+        Runs on the pool right after activation, commands answer from the restored
+        snapshot meanwhile and the refresh revalidates the restored responses. Deadlines
+        of jobs and couriers that passed while the bot was down are not announced.
+        """
+        state = self.load_warm_start()
+        if state is not None:
+            self.names.restore(state['names'])
+            self.engine.run(self.http.restore(state['responses']))
+            self.history.restore(state['history'])
+            for group, deadlines in state['deadlines'].items():
+                self.deadlines.replace(group, {key: Deadline(*deadline) for key, deadline in deadlines.items()})
+            if state['snapshot'] is not None:
+                snapshot = make_snapshot(*state['snapshot'])
+                if self.structures.restore(snapshot):
+                    self.record_history(snapshot)
+                    self.depletion.update(snapshot)
+                    self.update_reinforcement_deadlines(snapshot)
+                    if self.coordinator is None or self.coordinator.leads('pos'):
+                        self.arm_depletion_timer()
+                    self.warm_version = (snapshot.fetched_at, self.names.version, self.deadlines.version)
+                self.logger.info('Warm start with {} towers, {} names and {} responses'.format(
+                    len(snapshot.starbases), len(state['names']), len(state['responses'])))
+            self.arm_deadline_timer()
+        self.structures.get()
+        self.save_warm_start()
 
     ####################################################################################################################
     # poller
 
     def _poller_transactions_check(self):
-        lastTransactions = self.get_transactions(self.config['CORP_ID'])
-        for transaction in lastTransactions:
-            if self['last_trade_id'] < transaction['transaction_id']:
-                self['last_trade_id'] = transaction['transaction_id']
-                quantity = transaction['quantity']
-                typeName = transaction['type']['typeName']
-                action = "Sold" if transaction['is_buy'] == 0 else "Bought"
-                price = '{:,.2f}'.format(transaction['unit_price'])
-                priceTotal = '{:,.2f}'.format(
-                    quantity * transaction['unit_price'])
-                self.send(self.build_identifier(self.config['REPORT_TRADES_CHAN']),
-                          ":moneybag: {} {}x {} at {}. Total: {}".format(
-                              action, quantity, typeName, price, priceTotal))
+        synced = self.sync_stream('trades', '/corporation/wallet-transactions/', 'transaction_id')
+        for sync in synced:
+            tag = '[{}] '.format(sync.ticker) if sync.ticker else ''
+            for transaction in sync.rows:
+                if sync.last_id < transaction['transaction_id']:
+                    quantity = transaction['quantity']
+                    typeName = transaction['type']['typeName']
+                    action = "Sold" if transaction['is_buy'] == 0 else "Bought"
+                    price = '{:,.2f}'.format(transaction['unit_price'])
+                    priceTotal = '{:,.2f}'.format(
+                        quantity * transaction['unit_price'])
+                    self.report('trades', ":moneybag: {}{} {}x {} at {}. Total: {}".format(
+                        tag, action, quantity, typeName, price, priceTotal), sync.corpid)
+        self.record_poll('trades', any(sync.cursor['last_id'] > sync.last_id for sync in synced),
+                         self.stream_url('/corporation/wallet-transactions/'))
+        self.save_cursors({sync.key: sync.cursor for sync in synced})
 
     def _poller_contracts_check(self):
-        contracts = self.get_contracts(self.config['CORP_ID'])
-        for contract in contracts:
-            if contract['detail']['type'] == 'courier':
+        synced = self.sync_stream('contracts', '/corporation/contracts/', 'contract_id', lambda contract: (
+            contract['detail']['type'] == 'courier' and contract_open(contract['detail'])))
+        couriers = {sync.key: [contract for contract in sync.rows if contract['detail']['type'] == 'courier']
+                    for sync in synced}
+        for contract in chain.from_iterable(couriers.values()):
+            self.names.want('station', contract['detail']['start_location_id'])
+            self.names.want('station', contract['detail']['end_location_id'])
+        self.names.resolve()
+        messages = []
+        deadlines = []
+        for sync in synced:
+            tag = '[{}] '.format(sync.ticker) if sync.ticker else ''
+            known = self.load_statuses(
+                sync.key, [contract['detail']['contract_id'] for contract in couriers[sync.key]])
+            changed = {}
+            closed = []
+            expiring = {}
+            for contract in couriers[sync.key]:
                 # cast some vars
                 apiStatus = contract['detail']['status']
                 contractID = contract['detail']['contract_id']
@@ -293,276 +2452,419 @@ class Seat(BotPlugin):
                 destination = self.get_station_name(
                     contract['detail']['end_location_id'])
                 # check for updates
-                if self.redis.get(contractID):
-                    selfStatus = self.redis.get(contractID).decode('utf-8')
-                    if selfStatus != apiStatus:
-                        self.redis.set(contractID, apiStatus)
-                        self.send(self.build_identifier(self.config['REPORT_CONTRACTS_CHAN']),
-                                  ":airplane: Update: {} --> {} from {} to {}".format(
-                                      source, destination, selfStatus, apiStatus))
+                selfStatus = known[contractID]
+                if selfStatus is not None and selfStatus != apiStatus:
+                    changed[contractID] = apiStatus
+                    messages.append((sync.corpid, ":airplane: {}Update: {} --> {} from {} to {}".format(
+                        tag, source, destination, selfStatus, apiStatus)))
                 # check for new
-                if self['last_contract_id'] < contract['contract_id']:
-                    self['last_contract_id'] = contract['contract_id']
-                    self.redis.set(contractID, apiStatus)
-                    self.send(self.build_identifier(self.config['REPORT_CONTRACTS_CHAN']),
-                              ":airplane: New: {} - -> {} | {} volume  {} reward  {} collateral".format(
-                                  source, destination, volume, reward, collateral))
+                if sync.last_id < contract['contract_id']:
+                    changed[contractID] = apiStatus
+                    messages.append((
+                        sync.corpid, ":airplane: {}New: {} - -> {} | {} volume  {} reward  {} collateral".format(
+                            tag, source, destination, volume, reward, collateral)))
+                if apiStatus == 'outstanding':
+                    deadlines.append(seat_timestamp(contract['detail']['date_expired']))
+                    expiring[contractID] = Deadline(
+                        deadlines[-1], 'contracts', sync.corpid, sync.ticker,
+                        'Expired: {} --> {} | {} reward'.format(source, destination, reward))
+                # finished and expired contracts will not change again
+                if not contract_open(contract['detail']):
+                    changed.pop(contractID, None)
+                    if selfStatus is not None:
+                        closed.append(contractID)
+            self.store_statuses(sync.key, changed, closed)
+            self.replace_deadlines(sync.key, expiring)
+        for corpid, message in messages:
+            self.report('contracts', message, corpid)
+        self.record_poll('contracts', bool(messages), self.stream_url('/corporation/contracts/'), deadlines)
+        self.save_cursors({sync.key: sync.cursor for sync in synced})
 
     def _poller_industry_check(self):
-        jobs = self.get_industry(self.config['CORP_ID'])
-        for job in jobs:
-            # cast some vars
-            jobID = job['job_id']
-            installer = self.get_pilot(job['installer_id'])
-            apiStatus = job['status']
-            location = self.get_station_name(job['facility_id'])
-            typeName = self.get_item(job['blueprint_type_id'])
-            endDate = job['end_date']
-            d0 = datetime.datetime.strptime(
-                job['end_date'], '%Y-%m-%d %H:%M:%S')
-            d1 = datetime.datetime.utcnow()
-            delta = d0 - d1
-            timeLeft = self.strfdelta(delta, "{days}d {hours}h {minutes}m")
-            # check for updates
-            if self.redis.get(jobID):
-                selfStatus = self.redis.get(jobID).decode('utf-8')
-                if selfStatus != apiStatus:
-                    self.redis.set(jobID, apiStatus)
-                    self.send(self.build_identifier(self.config['REPORT_INDUSTRY_CHAN']),
-                              ":factory: Update: {} in {} by {} {} --> {}".format(
-                                  typeName, location, installer, selfStatus, apiStatus))
-
-            # check for new
-            if self['last_job_id'] < job['job_id']:
-                self['last_job_id'] = job['job_id']
-                self.redis.set(jobID, apiStatus)
-                self.send(self.build_identifier(self.config['REPORT_INDUSTRY_CHAN']),
-                          ":factory: New: {} by {} in {} ends {} timeleft {}".format(
-                              typeName, installer, location, endDate, timeLeft))
+        synced = self.sync_stream('industry', '/corporation/industry/', 'job_id',
+                                  lambda job: job['status'] in OPEN_JOB_STATES)
+        self.want_job_names(chain.from_iterable(sync.rows for sync in synced))
+        messages = []
+        deadlines = []
+        for sync in synced:
+            tag = '[{}] '.format(sync.ticker) if sync.ticker else ''
+            known = self.load_statuses(sync.key, [job['job_id'] for job in sync.rows])
+            changed = {}
+            closed = []
+            ending = {}
+            for job in sync.rows:
+                # cast some vars
+                jobID = job['job_id']
+                installer = self.get_pilot(job['installer_id'])
+                apiStatus = job['status']
+                location = self.get_station_name(job['facility_id'])
+                typeName = self.get_item(job['blueprint_type_id'])
+                endDate = job['end_date']
+                d0 = datetime.datetime.strptime(
+                    job['end_date'], '%Y-%m-%d %H:%M:%S')
+                d1 = datetime.datetime.utcnow()
+                delta = d0 - d1
+                timeLeft = self.strfdelta(delta, "{days}d {hours}h {minutes}m")
+                # check for updates
+                selfStatus = known[jobID]
+                if selfStatus is not None and selfStatus != apiStatus:
+                    changed[jobID] = apiStatus
+                    messages.append((sync.corpid, ":factory: {}Update: {} in {} by {} {} --> {}".format(
+                        tag, typeName, location, installer, selfStatus, apiStatus)))
+
+                # check for new
+                if sync.last_id < job['job_id']:
+                    changed[jobID] = apiStatus
+                    messages.append((sync.corpid, ":factory: {}New: {} by {} in {} ends {} timeleft {}".format(
+                        tag, typeName, installer, location, endDate, timeLeft)))
+                if apiStatus == 'active':
+                    deadlines.append(seat_timestamp(endDate))
+                    ending[jobID] = Deadline(deadlines[-1], 'industry', sync.corpid, sync.ticker,
+                                             'Ready: {} in {} by {}'.format(typeName, location, installer))
+                # finished jobs will not change again
+                if apiStatus not in OPEN_JOB_STATES:
+                    changed.pop(jobID, None)
+                    if selfStatus is not None:
+                        closed.append(jobID)
+            self.store_statuses(sync.key, changed, closed)
+            self.replace_deadlines(sync.key, ending)
+        for corpid, message in messages:
+            self.report('industry', message, corpid)
+        self.record_poll('industry', bool(messages), self.stream_url('/corporation/industry/'), deadlines)
+        self.save_cursors({sync.key: sync.cursor for sync in synced})
 
     def _poller_pos_check(self):
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-
-                if self.check_outdated(starbase) and self.check_warning(starbase['itemID'], 'warn_outdated'):
-                    self.set_warning(
-                        starbase['itemID'], 'warn_outdated', False)
-                    self.logger.info(
-                        "Reported outdated warning on {}".format(starbase['moonName']))
-                    self.send(self.build_identifier(self.config['REPORT_POS_CHAN']), '%s %s %s is outdated.' % (
-                        corp['ticker'], starbase['moonName'], starbase['starbaseTypeName']))
-
-                if self.check_fuel(starbase) and self.check_warning(starbase['itemID'], 'warn_fuel'):
-                    self.set_warning(starbase['itemID'], 'warn_fuel', False)
-                    self.logger.info(
-                        "Reported fuel warning on {}".format(starbase['moonName']))
-                    self.send(self.build_identifier(self.config['REPORT_POS_CHAN']),
-                              '%s %s %s  will run out of fuel in %s hours' % (
-                                  corp['ticker'], starbase['moonName'], starbase['starbaseTypeName'],
-                                  round(starbase['fuelBlocks'] / starbase['baseFuelUsage'])))
-
-                if self.check_reinforced(starbase) and self.check_warning(starbase['itemID'], 'warn_reinforced'):
-                    self.set_warning(
-                        starbase['itemID'], 'warn_reinforced', False)
-                    self.logger.info(
-                        "Reported reinforced warning on {}".format(starbase['moonName']))
-                    self.send(self.build_identifier(self.config['REPORT_POS_CHAN']),
-                              '%s %s %s got reinforced, Timer %s' % (
-                                  corp['ticker'], starbase['moonName'], starbase['starbaseTypeName'],
-                                  starbase['stateTimeStamp']))
-
-                if self.check_stront(starbase) and self.check_warning(starbase['itemID'], 'warn_stront'):
-                    self.set_warning(starbase['itemID'], 'warn_stront', False)
-                    self.logger.info(
-                        "Reported stront warning on {}".format(starbase['moonName']))
-                    self.send(self.build_identifier(self.config['REPORT_POS_CHAN']),
-                              '%s %s %s has only stront for %s hours' % (
-                                  corp['ticker'], starbase['moonName'], starbase['starbaseTypeName'],
-                                  round(starbase['strontium'] / starbase['baseStrontUsage'])))
-
-    def _poller_pos_clear_warnings(self):
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-
-                if not self.check_fuel(starbase) and not self.check_warning(starbase['itemID'], 'warn_fuel'):
-                    self.set_warning(starbase['itemID'], 'warn_fuel', True)
-                    self.logger.info(
-                        "Reenabled fuel warning on {}".format(starbase['moonName']))
-
-                if not self.check_stront(starbase) and not self.check_warning(starbase['itemID'], 'warn_stront'):
-                    self.set_warning(starbase['itemID'], 'warn_stront', True)
-                    self.logger.info(
-                        "Reenabled stront warning on {}".format(starbase['moonName']))
-
-                if not self.check_outdated(starbase) and not self.check_warning(starbase['itemID'], 'warn_outdated'):
-                    self.set_warning(starbase['itemID'], 'warn_outdated', True)
-                    self.logger.info(
-                        "Reenabled outdated warning on {}".format(starbase['moonName']))
-
-                if not self.check_reinforced(starbase) and not self.check_warning(starbase['itemID'],
-                                                                                  'warn_reinforced'):
-                    self.set_warning(
-                        starbase['itemID'], 'warn_reinforced', True)
-                    self.logger.info(
-                        "Reenabled reinforced warning on {}".format(starbase['moonName']))
+        # warnings are evaluated by on_structures whenever the snapshot is refreshed
+        previous = self.structures.snapshot
+        if self.structures.get() is previous:
+            # still fresh, e.g. refreshed by a command, nothing was fetched
+            self.record_poll('pos', False, self.stream_url('/corporation/starbases/'))
 
     ####################################################################################################################
     # bot commands
 
     @botcmd
+    @timed
     def jobs_all(self, msg, args):
-        """Prints out all industry jobs"""
-        if args != '':
-            yield 'Usage: !jobs all'
-        for job in self.get_industry(self.config['CORP_ID']):
-            # cast some vars
-            installer = self.get_pilot(job['installer_id'])
-            location = self.get_station_name(job['facility_id'])
-            typeName = self.get_item(job['blueprint_type_id'])
-            endDate = job['end_date']
-            d0 = datetime.datetime.strptime(
-                job['end_date'], '%Y-%m-%d %H:%M:%S')
-            d1 = datetime.datetime.utcnow()
-            delta = d0 - d1
-            timeLeft = self.strfdelta(delta, "{days}d {hours}h {minutes}m")
-            yield ":factory: {} in {} by {}, ends on {}, timeleft: {}".format(
-                typeName, location, installer, endDate, timeLeft)
+        """Prints out all industry jobs, Usage: !jobs all"""
+        sort_keys = {'end': lambda job: job['end_date'], 'status': lambda job: job['status'],
+                     'id': lambda job: job['job_id']}
+        parsed = self.parse_listing(args, sort_keys)
+        if parsed is None or parsed[0]:
+            yield 'Usage: !jobs all [--limit n] [--page n] [--sort end|status|id]'
+            return
+        jobs = self.get_industry(self.config['CORP_ID'])
+        if jobs is None:
+            yield 'Could not reach seat, try again later.'
+            return
+        jobs, page, pages, total = self.paged(jobs, parsed[1], sort_keys)
+        if not jobs:
+            yield 'Found no industry jobs.'
+            return
+
+        def rows():
+            # resolve names a batch at a time so the first message goes out early
+            for i in range(0, len(jobs), 20):
+                batch = jobs[i:i + 20]
+                self.want_job_names(batch)
+                for job in batch:
+                    d0 = datetime.datetime.strptime(
+                        job['end_date'], '%Y-%m-%d %H:%M:%S')
+                    d1 = datetime.datetime.utcnow()
+                    timeLeft = self.strfdelta(d0 - d1, "{days}d {hours}h {minutes}m")
+                    yield (self.get_item(job['blueprint_type_id']), self.get_station_name(job['facility_id']),
+                           self.get_pilot(job['installer_id']), job['status'], job['end_date'], timeLeft)
+
+        for message in self.render_tables(
+                ('Blueprint', 'Location', 'Installer', 'Status', 'Ends', 'Left'), rows(), page, pages, total):
+            yield message
+
+    def listing(self, rows, options, sort_keys, headers, render, empty):
+        """Replies with the requested page of rows, render turns a row into a tuple of cells"""
+        rows, page, pages, total = self.paged(rows, options, sort_keys)
+        if not rows:
+            yield empty
+            return
+        for message in self.render_tables(headers, (render(row) for row in rows), page, pages, total):
+            yield message
 
     @botcmd
+    @timed
     def pos_find(self, msg, args):
-        """Finds all towers in given <system>, Usage !pos find <system>"""
-        if args == '':
-            yield 'Usage: !pos find <system>'
+        """Finds all towers in given <system> or systems starting with it, Usage !pos find <system>"""
+        parsed = self.parse_listing(args, STARBASE_SORT_KEYS)
+        if parsed is None or not parsed[0]:
+            yield 'Usage: !pos find <system> [--limit n] [--page n] [--sort moon|system|corp|type|fuel]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-                if starbase['solarSystemName'].lower() == args.lower():
-                    results += 1
-                    yield "**Location:** %s **Type:** %s **Corp:** %s " % (
-                        starbase['moonName'], starbase['starbaseTypeName'], corp['ticker'])
-        if results == 0:
-            yield "Found no towers in %s" % args
+        system = ' '.join(parsed[0])
+        index = self.structures.get(stale_ok=True).starbase_index
+        for message in self.listing(
+                index.in_system(system), parsed[1], STARBASE_SORT_KEYS,
+                ('Location', 'Type', 'Corp'),
+                lambda row: (row[1]['moonName'], row[1]['starbaseTypeName'], row[0]),
+                "Found no towers in %s" % system):
+            yield message
 
     @botcmd
+    @timed
     def poco_find(self, msg, args):
-        """Finds all pocos in given <system>, Usage !poco find <system>"""
-        if args == '':
-            yield 'Usage: !poco find <system>'
+        """Finds all pocos in given <system> or systems starting with it, Usage !poco find <system>"""
+        parsed = self.parse_listing(args, POCO_SORT_KEYS)
+        if parsed is None or not parsed[0]:
+            yield 'Usage: !poco find <system> [--limit n] [--page n] [--sort planet|system|corp|type]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for poco in self.get_pocos(corp['corporationID']):
-                if poco['solarSystemName'].lower() == args.lower():
-                    results += 1
-                    yield "**Location:** %s **Type:** %s **Corp:** %s" % (
-                        poco['planetName'], poco['planetTypeName'], corp['ticker'])
-        if results == 0:
-            yield "Found no pocos in %s" % args
+        system = ' '.join(parsed[0])
+        index = self.structures.get(stale_ok=True).poco_index
+        for message in self.listing(
+                index.in_system(system), parsed[1], POCO_SORT_KEYS,
+                ('Location', 'Type', 'Corp'),
+                lambda row: (row[1]['planetName'], row[1]['planetTypeName'], row[0]),
+                "Found no pocos in %s" % system):
+            yield message
 
     @botcmd
+    @timed
+    def pos_history(self, msg, args):
+        """Shows the fuel, stront and state samples kept of a tower, Usage: !pos history <moon>"""
+        parsed = self.parse_listing(args, {})
+        if parsed is None or not parsed[0]:
+            yield 'Usage: !pos history <moon> [--limit n] [--page n]'
+            return
+        moon = ' '.join(parsed[0])
+        snapshot = self.structures.get(stale_ok=True)
+        towers = ([row for row in snapshot.starbases if row[1]['moonName'].lower() == moon.lower()] or
+                  [row for row in snapshot.starbases if row[1]['moonName'].lower().startswith(moon.lower())])
+        if not towers:
+            yield "Found no tower at %s" % moon
+            return
+        if len(towers) > 1:
+            yield "Found %d towers at %s: %s" % (
+                len(towers), moon, ', '.join(sorted(starbase['moonName'] for _, starbase in towers)[:10]))
+            return
+        ticker, starbase = towers[0]
+        columns = snapshot.starbase_columns
+        pos = columns.position[starbase['itemID']]
+        burn = columns.observed_burn[pos]
+        yield '%s %s %s burns %s fuel per hour (base %s), %s hours left' % (
+            ticker, starbase['moonName'], starbase['starbaseTypeName'],
+            'unknown' if np.isnan(burn) else round(burn, 1), starbase['baseFuelUsage'],
+            round(columns.fuel_hours()[pos]))
+        for message in self.listing(
+                self.history.samples(starbase['itemID']), parsed[1], {},
+                ('Sampled', 'Fuel', 'Stront', 'State'),
+                lambda sample: (datetime.datetime.utcfromtimestamp(sample[0]).strftime('%Y-%m-%d %H:%M'),
+                                sample[1], sample[2], STARBASE_STATES.get(sample[3], sample[3])),
+                "No samples of %s yet." % starbase['moonName']):
+            yield message
+
+    @botcmd
+    @timed
+    def pos_burn(self, msg, args):
+        """Lists the observed fuel burn of all online towers, Usage: !pos burn"""
+        sort_keys = dict(STARBASE_SORT_KEYS, hours=lambda row: row[0],
+                         burn=lambda row: -1 if np.isnan(row[1]) else row[1])
+        # rows are (hours left, observed burn, ticker, starbase) here
+        sort_keys.update((key, lambda row, key=key: STARBASE_SORT_KEYS[key](row[2:])) for key in STARBASE_SORT_KEYS)
+        parsed = self.parse_listing(args, sort_keys)
+        if parsed is None or parsed[0]:
+            yield 'Usage: !pos burn [--limit n] [--page n] [--sort hours|burn|moon|corp|type]'
+            return
+        snapshot = self.structures.get(stale_ok=True)
+        columns = snapshot.starbase_columns
+        online = np.flatnonzero(columns.state == 4)
+        rows = [(hours, burn) + snapshot.starbases[pos] for pos, hours, burn in zip(
+            online.tolist(), columns.fuel_hours()[online].tolist(), columns.observed_burn[online].tolist())]
+        rows.sort(key=lambda row: row[0])
+        for message in self.listing(
+                rows, parsed[1], sort_keys,
+                ('Location', 'Corp', 'Burn/h', 'Base/h', 'Hours left'),
+                lambda row: (row[3]['moonName'], row[2], '-' if np.isnan(row[1]) else round(row[1], 1),
+                             row[3]['baseFuelUsage'], round(row[0]) if np.isfinite(row[0]) else '-'),
+                "Found no online towers."):
+            yield message
+
+    @botcmd
+    @timed
     def pos_oof(self, msg, args):
         """Finds all towers that will be running out of fuel in the given timeframe, Usage: !pos oof <hours>"""
-        if args == '' or args.isdigit() is False:
-            yield 'Usage: !pos oof <hours>'
+        sort_keys = dict(STARBASE_SORT_KEYS, hours=lambda row: row[0])
+        # rows are (hours left, ticker, starbase) here
+        sort_keys.update((key, lambda row, key=key: STARBASE_SORT_KEYS[key](row[1:])) for key in STARBASE_SORT_KEYS)
+        parsed = self.parse_listing(args, sort_keys)
+        if parsed is None or len(parsed[0]) != 1 or not parsed[0][0].isdigit():
+            yield 'Usage: !pos oof <hours> [--limit n] [--page n] [--sort hours|moon|corp|type]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-                hours_left = starbase['fuelBlocks'] / starbase['baseFuelUsage']
-                if int(hours_left) < int(args) and int(hours_left) != 0:
-                    results += 1
-                    yield "**Location:** %s **Type:** %s **Corp:** %s **Hours of fuel left:** %s" % (
-                        starbase['moonName'], starbase['starbaseTypeName'], corp['ticker'], round(hours_left))
-        if results == 0:
-            yield "Found no offline towers."
+        self.structures.get(stale_ok=True)
+        for message in self.listing(
+                self.depletion.running_out(int(parsed[0][0])), parsed[1], sort_keys,
+                ('Location', 'Type', 'Corp', 'Hours of fuel left'),
+                lambda row: (row[2]['moonName'], row[2]['starbaseTypeName'], row[1], round(row[0])),
+                "Found no towers running out of fuel."):
+            yield message
 
     @botcmd
+    @timed
     def pos_reinforced(self, msg, args):
-        """Finds all reinforced towers , Usage: !pos reinforced"""
-        if args != '':
-            yield 'Usage: !pos reinforced'
+        """Finds all reinforced towers, Usage: !pos reinforced"""
+        sort_keys = dict(STARBASE_SORT_KEYS, timer=lambda row: row[1]['stateTimeStamp'])
+        parsed = self.parse_listing(args, sort_keys)
+        if parsed is None or parsed[0]:
+            yield 'Usage: !pos reinforced [--limit n] [--page n] [--sort timer|moon|corp|type]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-                if starbase['state'] == 3:
-                    results += 1
-                    yield "%s - %s - %s. Timer: %s" % (
-                        starbase['moonName'], starbase['starbaseTypeName'], corp['ticker'], starbase['stateTimeStamp'])
-        if results == 0:
-            yield "Did not find any reinforced towers."
+        index = self.structures.get(stale_ok=True).starbase_index
+        for message in self.listing(
+                index.select(states=[3]), parsed[1], sort_keys,
+                ('Location', 'Type', 'Corp', 'Timer'),
+                lambda row: (row[1]['moonName'], row[1]['starbaseTypeName'], row[0], row[1]['stateTimeStamp']),
+                "Did not find any reinforced towers."):
+            yield message
 
     @botcmd
+    @timed
     def pos_oos(self, msg, args):
         """Finds all towers that have no stront, Usage: !pos oos"""
-        if args != '':
-            yield 'Usage: !pos oos'
+        parsed = self.parse_listing(args, STARBASE_SORT_KEYS)
+        if parsed is None or parsed[0]:
+            yield 'Usage: !pos oos [--limit n] [--page n] [--sort moon|system|corp|type]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(corp['corporationID']):
-                if starbase['strontium'] == 0 and starbase['state'] == 4:
-                    results += 1
-                    yield "**Location:** %s **Type:** %s **Corp:** %s has no strontium." % (
-                        starbase['moonName'], starbase['starbaseTypeName'], corp['ticker'])
-        if results == 0:
-            yield "Found no towers without stront."
+        index = self.structures.get(stale_ok=True).starbase_index
+        rows = [row for row in index.select(states=[4]) if row[1]['strontium'] == 0]
+        for message in self.listing(
+                rows, parsed[1], STARBASE_SORT_KEYS,
+                ('Location', 'Type', 'Corp'),
+                lambda row: (row[1]['moonName'], row[1]['starbaseTypeName'], row[0]),
+                "Found no towers without stront."):
+            yield message
 
     @botcmd
+    @timed
     def pos_offline(self, msg, args):
         """Finds all offline towers, Usage: !pos offline"""
-        if args != '':
-            yield 'Usage: !pos offline'
+        parsed = self.parse_listing(args, STARBASE_SORT_KEYS)
+        if parsed is None or parsed[0]:
+            yield 'Usage: !pos offline [--limit n] [--page n] [--sort moon|system|corp|type]'
             return
-        results = 0
-        for corp in self.get_corps():
-            for starbase in self.get_starbases(['corporationID']):
-                if starbase['state'] == 1 or starbase['state'] == 0:
-                    results += 1
-                    yield "**Location:** %s **Type:** %s **Corp:** %s" % (
-                        starbase['moonName'], starbase['starbaseTypeName'], corp['ticker'])
-        if results == 0:
-            yield "found no offline towers."
+        index = self.structures.get(stale_ok=True).starbase_index
+        for message in self.listing(
+                index.select(states=[0, 1]), parsed[1], STARBASE_SORT_KEYS,
+                ('Location', 'Type', 'Corp'),
+                lambda row: (row[1]['moonName'], row[1]['starbaseTypeName'], row[0]),
+                "found no offline towers."):
+            yield message
 
     @botcmd(admin_only=True)
+    @timed
     def pos_clearwarnings(self, msg, args):
         """Clears all saved warning states"""
         if args != '':
             return "Usage !pos clearwarnings"
-        for item in self:
-            del self[item]
+        with self.warnings_lock:
+            self.save_state('warnings', {})
         return "Cleared all saved warning states."
 
     @botcmd(admin_only=True, hidden=True)
-    def pos_clearwarningspos(self, msg, args):
-        """Trigger _poller_pos_clear_warnings"""
-        self._poller_pos_clear_warnings()
-
-    @botcmd(admin_only=True, hidden=True)
+    @timed
     def pos_checkpos(self, msg, args):
-        """Trigger _poller_pos_check"""
-        self._poller_pos_check()
+        """Refetch starbases and evaluate warnings now"""
+        self.structures.get(max_age=0)
+
+    @botcmd
+    @timed
+    def seat_upcoming(self, msg, args):
+        """Lists jobs ending, towers leaving reinforcement and couriers expiring, Usage: !seat upcoming <hours>"""
+        parsed = self.parse_listing(args, DEADLINE_SORT_KEYS)
+        if parsed is None or len(parsed[0]) != 1 or not parsed[0][0].isdigit():
+            yield 'Usage: !seat upcoming <hours> [--limit n] [--page n] [--sort when|corp|stream]'
+            return
+        # reinforcement timers come with the snapshot
+        self.structures.get(stale_ok=True)
+        now = time.time()
+        for message in self.listing(
+                self.deadlines.upcoming(int(parsed[0][0]) * 3600, now), parsed[1], DEADLINE_SORT_KEYS,
+                ('When', 'In', 'Corp', 'What'),
+                lambda deadline: (
+                    datetime.datetime.utcfromtimestamp(deadline.at).strftime('%Y-%m-%d %H:%M'),
+                    self.strfdelta(datetime.timedelta(seconds=deadline.at - now), "{days}d {hours}h {minutes}m"),
+                    deadline.ticker or '', deadline.text),
+                "Nothing happens in the next %s hours." % parsed[0][0]):
+            yield message
+
+    @botcmd(admin_only=True)
+    @timed
+    def seat_stats(self, msg, args):
+        """Shows poller, command and upstream timings, name cache hits and redis round trips"""
+        def durations(name, label):
+            return [(dict(labels)[label], count, '{:.0f}'.format(total / count * 1000), '{:.0f}'.format(peak * 1000))
+                    for labels, (count, total, peak) in sorted(self.metrics.histogram(name).items())]
+
+        pollers = durations('seat_poller_seconds', 'poller')
+        if pollers:
+            yield from self.render_tables(('Poller', 'Runs', 'Avg ms', 'Max ms'), pollers)
+        commands = durations('seat_command_seconds', 'command')
+        if commands:
+            yield from self.render_tables(('Command', 'Calls', 'Avg ms', 'Max ms'), commands)
+
+        statuses = defaultdict(list)
+        for labels, value in self.metrics.counter('seat_upstream_requests_total').items():
+            labels = dict(labels)
+            statuses[labels['endpoint']].append('{}x{}'.format(int(value), labels['status']))
+        upstream = [(name, count, avg, peak, ' '.join(sorted(statuses[name])))
+                    for name, count, avg, peak in durations('seat_upstream_seconds', 'endpoint')]
+        if upstream:
+            yield from self.render_tables(('Endpoint', 'Requests', 'Avg ms', 'Max ms', 'Status'), upstream)
+
+        lookups = {dict(labels)['source']: int(value)
+                   for labels, value in self.metrics.counter('seat_name_lookups_total').items()}
+        total = sum(lookups.values())
+        round_trips = {dict(labels)['op']: int(value)
+                       for labels, value in self.metrics.counter('seat_redis_round_trips_total').items()}
+        announced = sum(self.metrics.counter('seat_announcements_total').values())
+        sent = sum(self.metrics.counter('seat_messages_sent_total').values())
+        yield 'Next polls: ' + ', '.join('{} in {}m'.format(stream, max(0, round(plan.delay() / 60)))
+                                         for stream, plan in sorted(self.plans.items()))
+        yield 'Names: {} lookups, {:.0%} memory, {:.0%} redis, {:.0%} esi, {} failed, {} known missing\n' \
+              'Redis: {} round trips ({})\nMessages: {} announcements sent as {} messages'.format(
+                  total, lookups.get('memory', 0) / (total or 1), lookups.get('redis', 0) / (total or 1),
+                  lookups.get('esi', 0) / (total or 1), lookups.get('failed', 0), lookups.get('missing', 0),
+                  sum(round_trips.values()),
+                  ', '.join('{} {}'.format(op, n) for op, n in sorted(round_trips.items())) or 'none',
+                  int(announced), int(sent))
 
     @botcmd(admin_only=True, hidden=True)
+    @timed
     def trigger_trades(self, msg, args):
         self._poller_transactions_check()
 
     @botcmd(admin_only=True, hidden=True)
+    @timed
     def trigger_industry(self, msg, args):
         self._poller_industry_check()
 
     @botcmd(admin_only=True, hidden=True)
+    @timed
     def trigger_contracts(self, msg, args):
         self._poller_contracts_check()
 
     @botcmd(admin_only=True, hidden=True)
+    @timed
     def debug_clearids(self, msg, args):
-        for item in self:
-            del self[item]
+        self.save_cursors({key: dict(cursor, last_id=1, page=0) for key, cursor in self.load_cursors().items()})
         return 'All IDs have been cleared'
 
     @botcmd(admin_only=True, hidden=True)
+    @timed
+    def debug_rewind(self, msg, args):
+        """Makes the next poll report everything after <id> again, Usage: !debug rewind <stream>:<corpid> <id>"""
+        args = args.split()
+        cursors = self.load_cursors()
+        if len(args) != 2 or args[0] not in cursors or not args[1].isdigit():
+            return 'Usage: !debug rewind <{}> <id>'.format('|'.join(sorted(cursors)))
+        cursor = dict(cursors[args[0]], last_id=int(args[1]))
+        self.save_cursors({args[0]: cursor})
+        return 'Rewound {} to {}'.format(args[0], args[1])
+
+    @botcmd(admin_only=True, hidden=True)
+    @timed
     def debug_giveids(self, msg, args):
-        return 'Last TradeID: {}, Last ContractID: {}, Last IndustryID: {}'.format(
-            self['last_trade_id'], self['last_contract_id'], self['last_job_id'])
+        return ', '.join(
+            'Last {}: {}'.format(key, cursor['last_id']) for key, cursor in sorted(self.load_cursors().items()))